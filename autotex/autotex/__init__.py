@@ -2,18 +2,23 @@
 
 import argparse
 import binascii
+import concurrent.futures
 import contextlib
 import fcntl
+import glob
 import gzip
 import hashlib
+import io
+import json
 import msgpack
-import operator
 import os
 import os.path
 import pyinotify
 import re
+import shlex
 import shutil
 import signal
+import socket
 import subprocess
 import sys
 import tempfile
@@ -21,21 +26,45 @@ import threading
 import time
 import yaml
 
+from . import client
+
 
 # =============================================================================
 # ================= HELPER LIBS ===============================================
 # =============================================================================
 def get_equivalent(container, item, default=None):
+    if isinstance(container, dict):
+        return container.get(item, default)
     for element in container:
         if element == item:
             return element
     return default
 
 
+def calc_checksum(path):
+    try:
+        with open(path, 'rb') as binfile:
+            return hashlib.sha256(binfile.read()).digest()
+    except IOError:
+        return b''
+
+
+def get_mtime(path):
+    try:
+        return os.path.getmtime(path)
+    except OSError:
+        return 0.0
+
+
 # =============================================================================
 # ================= CLASSES ===================================================
 # =============================================================================
 class Action(object):
+    background = False
+    default_duration = 0.0
+    duration = None
+    parallel = False
+
     def __init__(self, dirty=True):
         self.deps = set()
         self.influences = set()
@@ -106,13 +135,31 @@ class Action(object):
     def priority(self):
         return 0
 
-    def needs_update(self):
+    def expected_duration(self):
+        if self.duration is None:
+            return self.default_duration
+        return self.duration
+
+    def record_duration(self, seconds):
+        # exponential moving average, smooths out outliers
+        if self.duration is None:
+            self.duration = seconds
+        else:
+            self.duration = 0.5 * self.duration + 0.5 * seconds
+
+    def successors(self, actions):
+        return self.influences
+
+    def needs_update(self, builder):
         return self.dirty
 
+    def note_change(self, path):
+        pass
+
     def check_status(self):
         return 0
 
-    def update(self):
+    def update(self, builder):
         self.dirty = False
         for action in self.influences:
             action.dirty = True
@@ -144,16 +191,16 @@ class FileAction(Action):
     def priority(self):
         return -100
 
-    def needs_update(self):
-        return super().needs_update() \
-            or (self.path not in INOTIFY_FILTER
-                and self.checksum != self.calc_file_checksum())
+    def needs_update(self, builder):
+        return super().needs_update(builder) \
+            or (self.path not in builder.filter
+                and self.checksum != self.calc_file_checksum(builder))
 
-    def update(self):
-        if self.path not in INOTIFY_FILTER:
-            INOTIFY_FILTER.add(self.path)
+    def update(self, builder):
+        if self.path not in builder.filter:
+            builder.filter.add(self.path)
 
-        self.checksum = self.calc_file_checksum()
+        self.checksum = self.calc_file_checksum(builder)
         checksum_string = str(binascii.hexlify(self.checksum), 'utf8')
         if len(checksum_string) > 9:
             checksum_string = '{}.{}'.format(
@@ -163,29 +210,32 @@ class FileAction(Action):
         print_changed('Changed ({}): {}'.format(
             checksum_string,
             self.path
-        ))
+        ), stream=builder.output)
 
-        super().update()
+        for action in self.influences:
+            action.note_change(self.path)
+        super().update(builder)
         return []
 
-    def calc_file_checksum(self):
-        try:
-            with open(self.path, 'rb') as binfile:
-                return hashlib.sha256(binfile.read()).digest()
-        except IOError:
-            return b''
+    def calc_file_checksum(self, builder):
+        return calc_checksum(builder.abspath(self.path))
 
 
 class CommandAction(Action):
-    def __init__(self, command, ignores=None):
+    default_duration = 1.0
+
+    def __init__(self, command, ignores=None, cwd=''):
         super().__init__()
         self.command = command
+        self.cwd = cwd
         self.ignores = ignores or []
+        self.outputs = []
         self.status = None
 
     def __eq__(self, other):
         if isinstance(other, CommandAction):
             return (self.command == other.command) \
+                and (self.cwd == other.cwd) \
                 and (self.ignores == other.ignores)
         else:
             return False
@@ -194,36 +244,155 @@ class CommandAction(Action):
         return not self == other
 
     def __hash__(self):
-        return hash(self.command)
+        return hash((self.cwd, self.command))
 
     def __str__(self):
-        return self.command
+        if self.cwd:
+            return '{} (in {})'.format(self.command_line(), self.cwd)
+        return self.command_line()
 
     def priority(self):
         return 100
 
+    def successors(self, actions):
+        # written files connect commands, e.g. biber => .bbl => lualatex
+        outputs = (
+            get_equivalent(actions, FileAction(path))
+            for path in self.outputs
+        )
+        return self.influences.union(o for o in outputs if o is not None)
+
     def check_status(self):
         return self.status
 
-    def update(self):
-        # run child process and redirect output
-        print_execute(self.command + ': -', False)
-        tfname = CONFIG['tmpdir'] + '/trace.log'
+    def update(self, builder):
+        tfname = os.path.join(
+            builder.tmpdir,
+            'trace.{}.log'.format(threading.get_ident())
+        )
+        snapshot = None
+        existing = None
+        entry = None
+        self.started = time.time()
+        if builder.cache:
+            with builder.profiler.span(str(self), 'cache'):
+                snapshot = builder.cache.snapshot(self)
+                entry = builder.cache.restore(self, snapshot)
+                if entry is None:
+                    existing = builder.cache.existing()
+        if entry is not None:
+            # reuse the results of an earlier run with the same inputs
+            if not self.parallel:
+                print_execute(
+                    str(self) + ': ' + self.get_process_char(0),
+                    False,
+                    stream=builder.output
+                )
+            targets = set(entry['inputs'])
+            written = set(entry['outputs'])
+            self.status = entry['status']
+        else:
+            while True:
+                # run child process and redirect output
+                self.started = time.time()
+                if not self.parallel:
+                    print_execute(
+                        str(self) + ': ' + self.get_process_char(0),
+                        False,
+                        stream=builder.output
+                    )
+                with builder.profiler.span(str(self), 'process'):
+                    start = time.perf_counter()
+                    stale = self.run(builder, tfname)
+                if not stale:
+                    # cut short and failed runs say nothing about the next one
+                    if self.status == 0:
+                        self.record_duration(time.perf_counter() - start)
+                    break
+
+                # inputs changed during the run, so drop the outdated results
+                self.report(builder, print_changed, 'RESTART')
+                if os.path.exists(tfname):
+                    os.remove(tfname)
+                for faction in stale:
+                    faction.update(builder)
+                if builder.cache:
+                    with builder.profiler.span(str(self), 'cache'):
+                        snapshot = builder.cache.snapshot(self)
+                        existing = builder.cache.existing()
+
+            # get and analyze trace log
+            with open(tfname) as tracefile, \
+                    builder.profiler.span(str(self), 'trace'):
+                targets, written = analyze_trace(
+                    tracefile,
+                    builder.config['basedir'],
+                    self.cwd
+                )
+            if builder.cache:
+                with builder.profiler.span(str(self), 'cache'):
+                    builder.cache.store(
+                        self,
+                        snapshot,
+                        [t for t in targets if not self.file_ignored(t)],
+                        written,
+                        existing
+                    )
+        self.outputs = sorted(written)
+
+        # generate new actions and deps
+        fas = set(
+            FileAction(path)
+            for path in targets
+            if not self.file_ignored(path)
+        ).difference(self.deps)
+        for faction in fas:
+            self.add_dependency(faction)
+        result = [
+            a
+            for fa in fas
+            for a in builder.detect_actions(fa.path)
+        ] + list(fas)
+
+        if entry is not None:
+            self.report(builder, print_execute, 'CACHED')
+        elif self.status == 0:
+            self.report(builder, print_execute, 'OK')
+        else:
+            self.report(
+                builder,
+                print_error,
+                'FAILED({})'.format(self.status)
+            )
+        super().update(builder)
+        return result
+
+    def run(self, builder, tfname):
         self.status = None
-        with open(CONFIG['log'], 'a') as flog, \
+        start = time.time()
+        inputs = dict(
+            (dep.path, dep)
+            for dep in self.deps
+            if isinstance(dep, FileAction) and dep.path not in self.outputs
+        )
+        seen = {}
+        with self.open_log(builder) as flog, \
                 contextlib.ExitStack() as stack:
             child = subprocess.Popen(
-                TRACE_CMD + ' ' + tfname + ' ' + self.command,
+                TRACE_CMD + ' ' + tfname + ' ' + self.command_line(),
                 shell=True,
                 stdout=subprocess.PIPE,
                 stderr=subprocess.PIPE,
-                universal_newlines=True
+                universal_newlines=True,
+                start_new_session=True,
+                cwd=builder.abspath(self.cwd)
             )
-            stack.callback(child.terminate)
+            stack.callback(self.kill, child)
             fcntl.fcntl(child.stdout, fcntl.F_SETFL, os.O_NONBLOCK)
             fcntl.fcntl(child.stderr, fcntl.F_SETFL, os.O_NONBLOCK)
             self.print_log_header(flog)
             counter = 0
+            shown = self.get_process_char(counter)
             while self.status is None:
                 status_new = child.poll()
                 out = child.stdout.read(1)
@@ -232,50 +401,101 @@ class CommandAction(Action):
                     self.status = status_new
 
                 changed = False
+                quiet = self.parallel
                 if out != '':
                     flog.write(out)
                     flog.flush()
-                    if CONFIG['print_stdout']:
-                        self.print_char(out, counter)
+                    if builder.config['print_stdout'] and not quiet:
+                        self.print_char(out, counter, builder.output)
                     changed = True
                 if err != '':
                     flog.write(err)
                     flog.flush()
-                    if CONFIG['print_stderr']:
-                        self.print_char(err, counter)
+                    if builder.config['print_stderr'] and not quiet:
+                        self.print_char(err, counter, builder.output)
                     changed = True
 
                 if changed:
                     counter = (counter + 1) % 4
-                    print_execute(
-                        '\b' + self.get_process_char(counter),
-                        False,
-                        True
-                    )
-                else:
-                    time.sleep(0.05)
+                if (changed or (self.get_process_char(counter) != shown)) \
+                        and not quiet:
+                    shown = self.get_process_char(counter)
+                    print_execute(self.erase() + shown, False, True,
+                                  stream=builder.output)
+                if not changed and (self.status is None):
+                    stale = self.stale_inputs(builder, start, inputs, seen)
+                    if stale:
+                        return stale
+                    if builder.interrupted.is_set():
+                        raise KeyboardInterrupt()
+                    builder.idle(0.05)
             stack.pop_all()
 
-        # get and analyze trace log
-        with open(tfname) as tracefile:
-            targets = analyze_trace(tracefile)
-
-        # generate new actions and deps
-        fas = set(
-            FileAction(path)
-            for path in targets
-            if not self.file_ignored(path)
-        ).difference(self.deps)
-        for faction in fas:
-            self.add_dependency(faction)
-        result = [a for fa in fas for a in detect_actions(fa.path)] + list(fas)
+        return []
 
-        if self.status == 0:
-            print_execute('\bOK', True, True)
+    def stale_inputs(self, builder, start, inputs, seen):
+        config = builder.config
+        if not (config['continuously'] and config['preempt']) \
+                or (time.time() - start < config['preempt_min_runtime']):
+            return []
+
+        stale = []
+        for path, stamp in list(builder.dirty.items()):
+            if (stamp > start) and (path in inputs) \
+                    and (seen.get(path) != stamp):
+                seen[path] = stamp
+                if inputs[path].needs_update(builder):
+                    stale.append(inputs[path])
+        return stale
+
+    @contextlib.contextmanager
+    def open_log(self, builder):
+        path = builder.abspath(builder.config['log'])
+        if not self.parallel:
+            with open(path, 'a') as flog:
+                yield flog
+            return
+
+        # buffered, so parallel runs do not interleave in the log
+        buf = io.StringIO()
+        try:
+            yield buf
+        finally:
+            with open(path, 'ab', buffering=0) as flog:
+                flog.write(buf.getvalue().encode('utf8'))
+
+    def report(self, builder, printer, msg):
+        # parallel runs print whole lines, so they do not garble each other
+        if self.parallel:
+            printer(str(self) + ': ' + msg, stream=builder.output)
         else:
-            print_error('\bFAILED({})'.format(self.status), True, True)
-        super().update()
-        return result
+            printer(self.erase() + msg, True, True, builder.output)
+
+    def kill(self, child):
+        try:
+            os.killpg(child.pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+        child.wait()
+
+    def seed_inputs(self, builder, actions):
+        # commands that only read their inputs used the current content of
+        # inputs that are older than the run, these must not trigger a second
+        # run
+        for faction in actions:
+            if isinstance(faction, FileAction) \
+                    and (faction.path not in self.outputs) \
+                    and (get_mtime(builder.abspath(faction.path))
+                         < self.started):
+                faction.checksum = faction.calc_file_checksum(builder)
+                faction.dirty = False
+                builder.filter.add(faction.path)
+
+    def command_line(self):
+        return self.command
+
+    def cache_id(self):
+        return self.cwd + '\0' + self.command_line()
 
     def file_ignored(self, path):
         return any(
@@ -284,17 +504,25 @@ class CommandAction(Action):
         )
 
     def get_process_char(self, counter):
-        return '-/|\\'[counter]
+        if self.duration is None:
+            return '-/|\\'[counter]
+
+        # progress estimated from the recorded durations
+        elapsed = time.time() - getattr(self, 'started', time.time())
+        return '{:2d}%'.format(min(99, int(100 * elapsed / self.duration)))
+
+    def erase(self):
+        return '\b' * (1 if self.duration is None else 3)
 
-    def print_char(self, char, counter):
-        string = '\b'
+    def print_char(self, char, counter, stream):
+        string = self.erase()
         if char == '\n':
             string += ' '
-        print_execute(string, False, True)
+        print_execute(string, False, True, stream)
 
-        print_error(char, False, True)
+        print_error(char, False, True, stream)
 
-        print_execute(self.get_process_char(counter), False, True)
+        print_execute(self.get_process_char(counter), False, True, stream)
 
     def print_log_header(self, flog):
         flog.write('\n')
@@ -306,9 +534,11 @@ class CommandAction(Action):
 class TexBibAction(CommandAction):
     def __init__(self, path):
         self.path = path
+        cwd, name = os.path.split(self.path)
         super().__init__(
-            command='biber ' + self.path,
-            ignores=[r"\.blg$", r"\.utf8$"]
+            command='biber ' + name,
+            ignores=[r"\.blg$", r"\.utf8$"],
+            cwd=cwd
         )
 
 
@@ -386,12 +616,271 @@ class TexCompileAction(CommandAction):
         else:
             raise Exception('Unsupported engine(' + self.engine + ')!')
 
-        cmd = cmd + ' ' + self.path
+        cwd, name = os.path.split(self.path)
+        cmd = cmd + ' ' + name
 
+        # only the own output, included figures are inputs; the checksums
+        # of externalized figures only trigger the figures themselves
+        output = re.escape(os.path.splitext(self.path)[0]) + r"\.pdf$"
         super().__init__(
             command=cmd,
-            ignores=[r"\.log$", r"\.pdf$"]
+            ignores=[r"\.log$", r"\.md5$", '^' + output],
+            cwd=cwd
+        )
+        self.changes = []
+        self.preview = []
+
+    def needs_update(self, builder):
+        # previews get completed outside of continues mode
+        return super().needs_update(builder) \
+            or (bool(self.preview) and not builder.previewing())
+
+    def note_change(self, path):
+        if path not in self.changes:
+            self.changes.append(path)
+
+    def update(self, builder):
+        changes = self.changes
+        self.changes = []
+        self.preview = self.select_preview(builder, changes)
+
+        if self.preview and builder.drafting():
+            # the drafts of the changed chapters get compiled instead
+            self.dirty = False
+            return []
+
+        outputs = self.outputs
+        result = super().update(builder)
+        if self.preview:
+            # skipped chapters keep their .aux files
+            self.outputs = sorted(set(self.outputs).union(outputs))
+        elif builder.drafting() and (self.status == 0):
+            result.extend(self.draft_actions(builder))
+        if self.status == 0:
+            result.extend(self.figure_actions(builder))
+        return result
+
+    def command_line(self):
+        if not self.preview:
+            return self.command
+
+        # compile the changed chapters only, the .aux files of the others
+        # keep references and page numbers stable
+        return '{} {}'.format(
+            self.compiler(),
+            includeonly_args(self.path, self.preview)
+        )
+
+    def compiler(self):
+        return self.command[:-len(os.path.basename(self.path)) - 1]
+
+    def draft_actions(self, builder):
+        # drafts follow the \include order of the document
+        try:
+            with open(builder.abspath(self.path)) as texfile:
+                order = re.findall(r"\\include\{([^}]+)\}", texfile.read())
+        except IOError:
+            order = []
+        rank = dict((n, i) for i, n in reversed(list(enumerate(order))))
+        cwd = os.path.dirname(self.path)
+        chapters = sorted(self.chapters(), key=lambda c: rank.get(
+            os.path.relpath(c, cwd or '.'),
+            len(order)
+        ))
+
+        auxfiles = [p for p in self.outputs if p.endswith('.aux')]
+        drafts = [
+            ChapterDraftAction(self.path, c, self.compiler(), auxfiles)
+            for c in chapters
+        ]
+        if drafts and shutil.which('pdfunite'):
+            return drafts + [
+                DraftUniteAction(self.path, [d.pdf for d in drafts])
+            ]
+        return drafts
+
+    def figure_actions(self, builder):
+        # tikz externalization (mode=list and make) lists the figures
+        figlist = os.path.splitext(self.path)[0] + '.figlist'
+        if figlist not in self.outputs:
+            return []
+        try:
+            with open(builder.abspath(figlist)) as listfile:
+                names = [n.strip() for n in listfile if n.strip()]
+        except IOError:
+            return []
+
+        # files of the document only matter through the figure checksums
+        shared = sorted(
+            d.path
+            for d in self.deps
+            if isinstance(d, FileAction)
+        )
+        cwd = os.path.dirname(self.path)
+        return [
+            TikzFigureAction(
+                self.path,
+                os.path.normpath(os.path.join(cwd, n)),
+                self.compiler(),
+                shared
+            )
+            for n in names
+        ]
+
+    def chapters(self):
+        # \include writes an .aux file for every chapter
+        root = os.path.splitext(self.path)[0]
+        deps = set(d.path for d in self.deps if isinstance(d, FileAction))
+        names = (
+            os.path.splitext(p)[0]
+            for p in self.outputs
+            if p.endswith('.aux')
         )
+        return [n for n in names if (n != root) and (n + '.tex' in deps)]
+
+    def select_preview(self, builder, changes):
+        if not builder.previewing():
+            return []
+
+        # only chapters and own outputs changed => keep previewing
+        sources = [c + '.tex' for c in self.chapters()]
+        touched = [p for p in changes if p in sources]
+        known = set(sources).union(self.outputs)
+        if (touched or self.preview) and all(p in known for p in changes):
+            return sorted(set(self.preview).union(
+                os.path.splitext(p)[0]
+                for p in touched
+            ))
+        return []
+
+
+class ChapterDraftAction(CommandAction):
+    parallel = True
+
+    def __init__(self, path, chapter, compiler, auxfiles):
+        self.path = path
+        self.chapter = chapter
+        self.auxfiles = auxfiles
+        cwd = os.path.dirname(self.path)
+        drafts = os.path.splitext(self.path)[0] + '.drafts'
+        self.outdir = os.path.join(
+            drafts,
+            os.path.relpath(self.chapter, cwd or '.')
+        )
+        self.pdf = self.outdir + '.pdf'
+        super().__init__(
+            command='{} -output-directory={} {}'.format(
+                compiler,
+                os.path.relpath(self.outdir, cwd or '.'),
+                includeonly_args(self.path, [self.chapter])
+            ),
+            ignores=[r"\.log$", '^' + re.escape(drafts) + '/'],
+            cwd=cwd
+        )
+
+    def merge(self, other):
+        super().merge(other)
+        self.auxfiles = other.auxfiles
+
+    def needs_update(self, builder):
+        # drafts are previews, the final output comes from the serial build
+        return builder.drafting() and super().needs_update(builder)
+
+    def update(self, builder):
+        # parallel jobs must not share their .aux files
+        cwd = os.path.dirname(self.path)
+        for path in self.auxfiles:
+            if os.path.exists(builder.abspath(path)):
+                BuildCache.copy(
+                    builder.abspath(path),
+                    builder.abspath(os.path.join(
+                        self.outdir,
+                        os.path.relpath(path, cwd or '.')
+                    ))
+                )
+
+        result = super().update(builder)
+
+        # hand a stable file to viewers
+        jobpdf = os.path.join(
+            self.outdir,
+            os.path.splitext(os.path.basename(self.path))[0] + '.pdf'
+        )
+        if (self.status == 0) and os.path.exists(builder.abspath(jobpdf)):
+            BuildCache.copy(builder.abspath(jobpdf), builder.abspath(self.pdf))
+            builder.filter.discard(self.pdf)
+        return result
+
+
+class DraftUniteAction(CommandAction):
+    def __init__(self, path, pdfs):
+        self.path = path
+        self.pdfs = pdfs
+        self.out = os.path.splitext(self.path)[0] + '.draft.pdf'
+        cwd = os.path.dirname(self.path)
+        super().__init__(
+            command='pdfunite {} {}'.format(
+                ' '.join(os.path.relpath(p, cwd or '.') for p in self.pdfs),
+                os.path.relpath(self.out, cwd or '.')
+            ),
+            ignores=['^' + re.escape(self.out) + '$'],
+            cwd=cwd
+        )
+
+    def needs_update(self, builder):
+        return builder.drafting() \
+            and all(os.path.exists(builder.abspath(p)) for p in self.pdfs) \
+            and super().needs_update(builder)
+
+    def update(self, builder):
+        result = super().update(builder)
+        self.seed_inputs(builder, result)
+        return result
+
+
+class TikzFigureAction(CommandAction):
+    parallel = True
+
+    def __init__(self, path, figure, compiler, shared):
+        self.path = path
+        self.figure = figure
+        self.shared = shared
+        self.pdf = self.figure + '.pdf'
+        cwd, name = os.path.split(self.path)
+        super().__init__(
+            command='{} -jobname={} {}'.format(
+                compiler,
+                os.path.relpath(self.figure, cwd or '.'),
+                shlex.quote(
+                    '\\def\\tikzexternalrealjob{'
+                    + os.path.splitext(name)[0]
+                    + '}\\input{' + name + '}'
+                )
+            ),
+            ignores=['^' + re.escape(self.figure) + r"\.(log|pdf)$"],
+            cwd=cwd
+        )
+
+    def merge(self, other):
+        super().merge(other)
+        self.shared = other.shared
+
+    def update(self, builder):
+        result = super().update(builder)
+
+        # the main job rewrites the .md5 file when the figure code changed
+        md5 = FileAction(self.figure + '.md5')
+        if md5 not in self.deps:
+            self.add_dependency(md5)
+            result.append(md5)
+
+        self.seed_inputs(builder, result)
+        return result
+
+    def file_ignored(self, path):
+        # the figure code is covered by the .md5 file of the figure, so
+        # edits elsewhere in the document do not trigger it
+        return (path in self.shared) or super().file_ignored(path)
 
 
 class TexIndexAction(CommandAction):
@@ -399,20 +888,1129 @@ class TexIndexAction(CommandAction):
         self.path = path
         self.out = out
         self.style = style
+        cwd, name = os.path.split(self.path)
         super().__init__('makeindex -q -s ' + self.style
-                         + ' -o ' + self.out
-                         + ' ' + self.path)
+                         + ' -o ' + os.path.relpath(self.out, cwd or '.')
+                         + ' ' + name,
+                         cwd=cwd)
+
+
+class ConvertAction(CommandAction):
+    parallel = True
+    template = None
+
+    def __init__(self, source, out, command=None):
+        self.source = source
+        self.out = out
+        cwd = os.path.dirname(self.source)
+        super().__init__(
+            command=(command or self.template).format(
+                **self.placeholders(cwd)
+            ),
+            ignores=['^' + re.escape(self.out) + '$'],
+            cwd=cwd
+        )
+
+    def placeholders(self, cwd):
+        return {
+            'source': os.path.basename(self.source),
+            'out': os.path.relpath(self.out, cwd or '.')
+        }
+
+    def update(self, builder):
+        result = super().update(builder)
+        self.seed_inputs(builder, result)
+        return result
+
+
+class EpsConvertAction(ConvertAction):
+    template = 'epstopdf --outfile={out} {source}'
+
+
+class GnuplotAction(ConvertAction):
+    template = 'gnuplot -e "set terminal pdfcairo; set output \'{out}\'" ' \
+        + '{source}'
+
+
+class MatplotlibAction(ConvertAction):
+    template = 'python3 {source} {out}'
+
+
+class SvgConvertAction(ConvertAction):
+    template = 'inkscape --export-type=pdf --export-filename={out} {source}'
+
+
+class PublishAction(ConvertAction):
+    background = True
+    template = 'gs -q -sDEVICE=pdfwrite -dCompatibilityLevel=1.5 ' \
+        + '-dPDFSETTINGS=/prepress -dCompressFonts=true ' \
+        + '-dEmbedAllFonts=true -dNOPAUSE -dBATCH ' \
+        + '-sOutputFile={out} {source} {marks}'
+
+    def __init__(self, source, out, marks, command=None):
+        self.marks = marks
+        super().__init__(source, out, command)
+
+    def placeholders(self, cwd):
+        result = super().placeholders(cwd)
+        result['marks'] = os.path.relpath(self.marks, cwd or '.')
+        return result
+
+    def needs_update(self, builder):
+        if not os.path.exists(builder.abspath(self.source)):
+            return False
+        return self.read_marks(builder) != self.marks_content(builder) \
+            or super().needs_update(builder)
+
+    def update(self, builder):
+        # only touch the file when the metadata changed, it is an input
+        content = self.marks_content(builder)
+        if self.read_marks(builder) != content:
+            with open(builder.abspath(self.marks), 'w') as marksfile:
+                marksfile.write(content)
+        return super().update(builder)
+
+    def marks_content(self, builder):
+        return '[ ' + ''.join(
+            '/{} {}\n  '.format(key[:1].upper() + key[1:], pdfmark_string(v))
+            for key, v in sorted(builder.config['publish'].items())
+        ) + '/DOCINFO pdfmark\n'
+
+    def read_marks(self, builder):
+        try:
+            with open(builder.abspath(self.marks)) as marksfile:
+                return marksfile.read()
+        except IOError:
+            return None
 
 
 class INotifyHandler(pyinotify.ProcessEvent):
+    def my_init(self, builder):
+        self.builder = builder
+
     def process_default(self, event):
-        with INOTIFY_CONDITION:
-            path = os.path.relpath(event.pathname)
-            if CONFIG['verbose']:
-                print_debug(path + ': ' + event.maskname)
-            if path in INOTIFY_FILTER:
-                INOTIFY_FILTER.remove(path)
-            INOTIFY_CONDITION.notify_all()
+        builder = self.builder
+        with builder.condition:
+            path = os.path.relpath(event.pathname, builder.config['basedir'])
+            if builder.config['verbose']:
+                print_debug(path + ': ' + event.maskname,
+                            stream=builder.output)
+            if path in builder.filter:
+                builder.filter.remove(path)
+            builder.dirty[path] = builder.debounce.event()
+            builder.condition.notify_all()
+
+
+class AdaptiveDebounce(object):
+    def __init__(self, wait, factor, minimum):
+        self.wait = wait
+        self.factor = factor
+        self.minimum = minimum
+        self.burst_start = None
+        self.last_event = None
+        self.last_finish = None
+        self.max_gap = 0.0
+        self.estimate = None
+        self.active = False
+
+    def event(self):
+        now = time.time()
+        if not self.active:
+            # events caused by running builds are no editor write bursts
+            return now
+        if self.burst_start is None:
+            self.burst_start = now
+
+            # a burst that starts right after the last one was cut too early
+            if (self.last_finish is not None) \
+                    and (now - self.last_finish < self.wait):
+                self.max_gap = now - self.last_finish
+        else:
+            self.max_gap = max(self.max_gap, now - self.last_event)
+        self.last_event = now
+        return now
+
+    def quiet_period(self):
+        if self.estimate is None:
+            return self.wait
+        return min(
+            max(self.estimate * self.factor, self.minimum),
+            self.wait
+        )
+
+    def remaining(self):
+        if self.last_event is None:
+            return 0.0
+        return self.last_event + self.quiet_period() - time.time()
+
+    def finish_burst(self):
+        start = self.burst_start
+        if start is not None:
+            if self.estimate is None:
+                self.estimate = self.max_gap
+            else:
+                self.estimate = 0.75 * self.estimate + 0.25 * self.max_gap
+            self.last_finish = time.time()
+
+        self.burst_start = None
+        self.last_event = None
+        self.max_gap = 0.0
+        return start
+
+
+class BuildCache(object):
+    def __init__(self, builder):
+        self.builder = builder
+        self.path = builder.abspath(
+            os.path.expanduser(builder.config['cache_dir'])
+        )
+        self.max_size = builder.config['cache_size']
+        self.hits = 0
+        self.misses = 0
+        for sub in ['blobs', 'entries', 'manifests']:
+            os.makedirs(os.path.join(self.path, sub), exist_ok=True)
+
+    def snapshot(self, action):
+        # digests of all possible inputs, taken before the command runs
+        known = dict(
+            (dep.path, dep)
+            for dep in action.deps
+            if isinstance(dep, FileAction)
+        )
+        paths = set(known.keys()).union(action.outputs)
+        for inputs in self.read(self.manifest_path(action), []):
+            paths.update(inputs)
+
+        snapshot = {}
+        for path in paths:
+            if (path in known) and (path in self.builder.filter) \
+                    and (known[path].checksum is not None):
+                snapshot[path] = known[path].checksum
+            else:
+                snapshot[path] = calc_checksum(self.builder.abspath(path))
+        return snapshot
+
+    def restore(self, action, snapshot):
+        for inputs in self.read(self.manifest_path(action), []):
+            key = self.key(action, inputs, snapshot)
+            entry_path = os.path.join(self.path, 'entries', key)
+            entry = self.read(entry_path)
+            if entry is None:
+                continue
+
+            for path, digest in entry['outputs'].items():
+                self.copy(
+                    os.path.join(self.path, 'blobs', digest),
+                    self.builder.abspath(path)
+                )
+                # the inotify thread cannot report the copies in time, so the
+                # restored files get checked in the next round
+                self.builder.filter.discard(path)
+            os.utime(entry_path)
+            self.hits += 1
+            return entry
+
+        self.misses += 1
+        return None
+
+    def existing(self):
+        basedir = self.builder.config['basedir']
+        result = set()
+        for dirpath, dirnames, filenames in os.walk(basedir):
+            dirnames[:] = [d for d in dirnames if not d.startswith('.')]
+            result.update(
+                os.path.relpath(os.path.join(dirpath, f), basedir)
+                for f in filenames
+            )
+        return result
+
+    def store(self, action, snapshot, inputs, written, existing):
+        # files that the command created itself were missing before the run
+        snapshot = dict(snapshot)
+        for path in written:
+            if (path in inputs) and (path not in snapshot) \
+                    and (path not in existing):
+                snapshot[path] = b''
+
+        # inputs that the command overwrote itself need their old digest
+        if action.status != 0 \
+                or any(p not in snapshot for p in written if p in inputs):
+            return
+
+        outputs = {}
+        for path in written:
+            abspath = self.builder.abspath(path)
+            if not os.path.isfile(abspath):
+                continue
+            digest = str(binascii.hexlify(calc_checksum(abspath)), 'utf8')
+            blob = os.path.join(self.path, 'blobs', digest)
+            if not os.path.exists(blob):
+                self.copy(abspath, blob)
+            outputs[path] = digest
+
+        inputs = sorted(inputs)
+        self.write(
+            os.path.join(self.path, 'entries', self.key(
+                action,
+                inputs,
+                snapshot
+            )),
+            {
+                'command': action.cache_id(),
+                'inputs': inputs,
+                'outputs': outputs,
+                'status': action.status
+            }
+        )
+
+        manifest_path = self.manifest_path(action)
+        manifest = [
+            m
+            for m in self.read(manifest_path, [])
+            if m != inputs
+        ]
+        self.write(manifest_path, [inputs] + manifest[:7])
+
+    def key(self, action, inputs, snapshot):
+        hasher = hashlib.sha256(action.cache_id().encode('utf8'))
+        for path in sorted(inputs):
+            hasher.update(b'\0' + path.encode('utf8') + b'\0')
+            if path in snapshot:
+                hasher.update(snapshot[path])
+            else:
+                hasher.update(calc_checksum(self.builder.abspath(path)))
+        return hasher.hexdigest()
+
+    def manifest_path(self, action):
+        return os.path.join(
+            self.path,
+            'manifests',
+            hashlib.sha256(action.cache_id().encode('utf8')).hexdigest()
+        )
+
+    def trim(self):
+        entries_dir = os.path.join(self.path, 'entries')
+        blobs_dir = os.path.join(self.path, 'blobs')
+        entries = sorted(
+            (os.path.join(entries_dir, n) for n in os.listdir(entries_dir)),
+            key=os.path.getmtime
+        )
+        blobs = dict(
+            (n, os.path.getsize(os.path.join(blobs_dir, n)))
+            for n in os.listdir(blobs_dir)
+        )
+
+        # count references, blobs are shared between entries
+        refs = {}
+        counts = dict((n, 0) for n in blobs)
+        for path in entries:
+            entry = self.read(path, {'outputs': {}})
+            refs[path] = set(entry['outputs'].values())
+            for digest in refs[path]:
+                counts[digest] = counts.get(digest, 0) + 1
+        size = sum(os.path.getsize(p) for p in entries) \
+            + sum(blobs.get(d, 0) for d, c in counts.items() if c)
+
+        # evict least recently used entries until everything fits
+        while entries and (size > self.max_size * 1024 * 1024):
+            oldest = entries.pop(0)
+            size -= os.path.getsize(oldest)
+            os.remove(oldest)
+            for digest in refs.pop(oldest):
+                counts[digest] -= 1
+                if counts[digest] == 0:
+                    size -= blobs.get(digest, 0)
+
+        for digest, count in counts.items():
+            if (count == 0) and (digest in blobs):
+                os.remove(os.path.join(blobs_dir, digest))
+
+    def finish(self):
+        stats_path = os.path.join(self.path, 'stats')
+        stats = self.read(stats_path, {'hits': 0, 'misses': 0})
+        stats['hits'] += self.hits
+        stats['misses'] += self.misses
+        self.write(stats_path, stats)
+        self.trim()
+        print_info('Cache: {} hits, {} misses ({} / {} total)'.format(
+            self.hits,
+            self.misses,
+            stats['hits'],
+            stats['misses']
+        ), stream=self.builder.output)
+
+    @staticmethod
+    def read(path, default=None):
+        try:
+            with open(path, 'rb') as infile:
+                return msgpack.unpackb(infile.read(), encoding='utf-8')
+        except (IOError, ValueError):
+            return default
+
+    @staticmethod
+    def temp_path(path):
+        # parallel actions can store the same blob at the same time
+        return '{}.{}.{}.new'.format(path, os.getpid(), threading.get_ident())
+
+    @staticmethod
+    def write(path, data):
+        tmp = BuildCache.temp_path(path)
+        with open(tmp, 'wb') as outfile:
+            outfile.write(msgpack.packb(data, use_bin_type=True))
+        os.replace(tmp, path)
+
+    @staticmethod
+    def copy(src, dst):
+        dirname = os.path.dirname(dst)
+        if dirname:
+            os.makedirs(dirname, exist_ok=True)
+        tmp = BuildCache.temp_path(dst)
+        shutil.copyfile(src, tmp)
+        os.replace(tmp, dst)
+
+
+class StateLock(object):
+    def __init__(self, path):
+        self.path = path
+        self.fd = None
+
+    def acquire(self, blocking=True):
+        if self.fd is None:
+            self.fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        flags = fcntl.LOCK_EX
+        if not blocking:
+            flags |= fcntl.LOCK_NB
+        try:
+            fcntl.flock(self.fd, flags)
+        except BlockingIOError:
+            return False
+
+        # tell waiting runs who they are waiting for
+        os.ftruncate(self.fd, 0)
+        os.pwrite(self.fd, str(os.getpid()).encode('utf8'), 0)
+        return True
+
+    def release(self):
+        # closing the descriptor drops the lock
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+    def held(self):
+        return self.fd is not None
+
+    def holder(self):
+        try:
+            with open(self.path) as lockfile:
+                return lockfile.read().strip() or '?'
+        except IOError:
+            return '?'
+
+
+class ClientStream(object):
+    def __init__(self, conn):
+        self.conn = conn
+        self.closed = False
+        self.lock = threading.Lock()
+
+    def write(self, data):
+        self.send({'out': data})
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def send(self, message):
+        # a vanished client must not abort the running build
+        # background actions write from other threads
+        with self.lock:
+            if not self.closed:
+                try:
+                    self.conn.sendall(
+                        msgpack.packb(message, use_bin_type=True)
+                    )
+                except OSError:
+                    self.closed = True
+
+
+class Profiler(object):
+    def __init__(self):
+        self.enabled = False
+        self.origin = time.perf_counter()
+        self.spans = []
+
+    @contextlib.contextmanager
+    def span(self, name, cat):
+        if not self.enabled:
+            yield
+            return
+
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.spans.append((
+                name,
+                cat,
+                start,
+                time.perf_counter() - start,
+                threading.get_ident()
+            ))
+
+    def export(self, path):
+        # Chrome/Perfetto trace event format, timestamps in microseconds
+        events = [
+            {
+                'name': name,
+                'cat': cat,
+                'ph': 'X',
+                'ts': int((start - self.origin) * 1e6),
+                'dur': int(duration * 1e6),
+                'pid': os.getpid(),
+                'tid': tid
+            }
+            for name, cat, start, duration, tid in self.spans
+        ]
+        with open(path, 'w') as tracefile:
+            json.dump(
+                {'traceEvents': events, 'displayTimeUnit': 'ms'},
+                tracefile
+            )
+
+    def summary(self, top, stream):
+        totals = {}
+        for name, cat, _, duration, _ in self.spans:
+            count, total = totals.get((cat, name), (0, 0.0))
+            totals[(cat, name)] = (count + 1, total + duration)
+        wall = time.perf_counter() - self.origin
+
+        print_info(
+            'Profile (top {} of {:.3f}s):'.format(top, wall),
+            stream=stream
+        )
+        ranked = sorted(totals.items(), key=lambda x: -x[1][1])
+        for (cat, name), (count, total) in ranked[:top]:
+            print_info('{:9.3f}s {:5.1f}% {:5}x {:9} {}'.format(
+                total,
+                100.0 * total / wall if wall else 0.0,
+                count,
+                cat,
+                name
+            ), stream=stream)
+
+    def finish(self, path, top, stream):
+        self.export(path)
+        if top > 0:
+            self.summary(top, stream)
+
+
+class Graph(object):
+    def __init__(self, actions=None):
+        self.actions = actions or {}
+
+    def __iter__(self):
+        return iter(self.actions)
+
+    def __len__(self):
+        return len(self.actions)
+
+    def __contains__(self, action):
+        return action in self.actions
+
+    def commands(self):
+        return [a for a in self.actions if isinstance(a, CommandAction)]
+
+    def merge(self, new):
+        if new in self.actions:
+            get_equivalent(self.actions, new).merge(new)
+        else:
+            self.actions[new] = new
+
+    def critical_paths(self):
+        # longest expected time from the start of an action to the end of the
+        # build, cycles (e.g. lualatex => .aux => lualatex) are cut
+        paths = {}
+        for root in self.actions:
+            if root in paths:
+                continue
+            stack = [(root, iter(root.successors(self.actions)))]
+            visiting = set([root])
+            while stack:
+                action, successors = stack[-1]
+                succ = next(successors, None)
+                if succ is None:
+                    stack.pop()
+                    visiting.discard(action)
+                    paths[action] = action.expected_duration() + max(
+                        (
+                            paths.get(s, 0.0)
+                            for s in action.successors(self.actions)
+                            if s not in visiting
+                        ),
+                        default=0.0
+                    )
+                elif (succ not in paths) and (succ not in visiting):
+                    visiting.add(succ)
+                    stack.append((succ, iter(succ.successors(self.actions))))
+        return paths
+
+    def save(self, path):
+        # build state
+        state = {
+            'state_version': STATE_VERSION,
+            'actions': [a.to_json() for a in self.actions]
+        }
+
+        # write to temporary file
+        state_tmp = path + '.new'
+        with gzip.GzipFile(
+            filename=path,
+            fileobj=open(state_tmp, 'wb')
+        ) as statefile:
+            statefile.write(msgpack.packb(state, use_bin_type=True))
+            statefile.flush()
+            os.fsync(statefile)
+
+        # finally overwrite old file
+        shutil.move(state_tmp, path)
+
+    @staticmethod
+    def load(path):
+        # load data from file
+        with gzip.open(path, 'rb') as statefile:
+            state = msgpack.unpackb(statefile.read(), encoding='utf-8')
+
+        # version check
+        if 'state_version' not in state \
+                or state['state_version'] != STATE_VERSION:
+            raise Exception('Incompatible state version!')
+
+        # create objects
+        actions = state['actions']
+        table = {}
+        for j in actions:
+            actiontype = globals()[j['type']]
+            obj = actiontype.__new__(actiontype)
+            obj.from_json(j)
+            table[j['id']] = obj
+
+        # restore dependency graph
+        for j in actions:
+            action = table[j['id']]
+            action.deps.update(table[y] for y in j['deps'])
+            action.influences.update(table[y] for y in j['influences'])
+
+        return Graph(dict((a, a) for a in table.values()))
+
+
+class Builder(object):
+    def __init__(self, config=None):
+        self.config = patch_dict(DEFAULT_CONFIG, config or {})
+        self.config['basedir'] = os.path.abspath(
+            self.config['basedir'] or os.getcwd()
+        )
+        self.graph = Graph()
+        self.cache = None
+        self.profiler = Profiler()
+        self.profiler.enabled = self.config['profile'] is not None
+        self.stack = None
+        self.tmpdir = None
+        self.executor = None
+        self.background = {}
+
+        # concurrent runs on the same project take turns
+        self.lock = StateLock(self.abspath(self.config['state']) + '.lock')
+        self.state_stamp = None
+
+        # file watching, shared with the inotify thread
+        self.condition = threading.Condition()
+        self.debounce = AdaptiveDebounce(
+            self.config['continuously_wait'],
+            self.config['continuously_wait_factor'],
+            self.config['continuously_wait_min']
+        )
+        self.dirty = {}
+        self.filter = set()
+        self.interrupted = threading.Event()
+        self.full_requested = False
+
+        # progress goes to the client of the current daemon request
+        self.output = None
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def open(self):
+        with contextlib.ExitStack() as stack:
+            if self.config['tmpdir'] is None:
+                self.tmpdir = stack.enter_context(
+                    tempfile.TemporaryDirectory()
+                )
+            else:
+                self.tmpdir = self.abspath(self.config['tmpdir'])
+            if self.profiler.enabled:
+                # the output can change until the builder gets closed
+                stack.callback(lambda: self.profiler.finish(
+                    self.abspath(self.config['profile']),
+                    self.config['profile_top'],
+                    self.output
+                ))
+
+            # setup build cache
+            if self.config['cache']:
+                self.cache = BuildCache(self)
+                stack.callback(self.cache.finish)
+
+            # background actions that are still running get killed on close
+            self.executor = concurrent.futures.ThreadPoolExecutor(
+                self.config['jobs'] or os.cpu_count()
+            )
+            stack.callback(self.executor.shutdown)
+            stack.callback(self.interrupted.set)
+
+            # setup inotify
+            mask = pyinotify.EventsCodes.ALL_FLAGS['IN_ATTRIB'] \
+                | pyinotify.EventsCodes.ALL_FLAGS['IN_CLOSE_WRITE'] \
+                | pyinotify.EventsCodes.ALL_FLAGS['IN_CREATE'] \
+                | pyinotify.EventsCodes.ALL_FLAGS['IN_DELETE'] \
+                | pyinotify.EventsCodes.ALL_FLAGS['IN_DELETE_SELF'] \
+                | pyinotify.EventsCodes.ALL_FLAGS['IN_MODIFY'] \
+                | pyinotify.EventsCodes.ALL_FLAGS['IN_MOVE_SELF'] \
+                | pyinotify.EventsCodes.ALL_FLAGS['IN_MOVED_FROM'] \
+                | pyinotify.EventsCodes.ALL_FLAGS['IN_MOVED_TO']
+            watch_manager = pyinotify.WatchManager()
+            notifier = pyinotify.ThreadedNotifier(
+                watch_manager,
+                INotifyHandler(builder=self)
+            )
+            stack.callback(notifier.stop)
+            notifier.start()
+            watch_manager.add_watch(
+                self.config['basedir'],
+                mask,
+                rec=True
+            )
+
+            self.stack = stack.pop_all()
+
+    def close(self):
+        self.release()
+        self.stack.close()
+        self.stack = None
+        self.cache = None
+        self.tmpdir = None
+        self.executor = None
+        self.background = {}
+
+    def abspath(self, path):
+        return os.path.join(self.config['basedir'], path)
+
+    def detect_actions(self, path, auto_only=True):
+        return detect_actions(
+            path,
+            self.config['command_map'],
+            auto_only,
+            self.config['basedir']
+        )
+
+    def acquire(self, blocking=True):
+        if self.lock.held():
+            return True
+        if not self.lock.acquire(False):
+            if not blocking:
+                return False
+            print_info('Waiting for autotex (pid {})'.format(
+                self.lock.holder()
+            ), stream=self.output)
+            with self.profiler.span('lock', 'state'):
+                self.lock.acquire()
+
+        # reuse the results of runs that finished meanwhile
+        if (self.state_stamp is not None) \
+                and (self.stat_state() != self.state_stamp):
+            self.restore()
+        return True
+
+    def release(self):
+        self.lock.release()
+
+    def stat_state(self):
+        try:
+            stat = os.stat(self.abspath(self.config['state']))
+        except OSError:
+            return None
+        return (stat.st_ino, stat.st_mtime_ns)
+
+    def restore(self):
+        try:
+            with self.profiler.span('restore_state', 'state'):
+                self.graph = Graph.load(self.abspath(self.config['state']))
+        except Exception:
+            return False
+
+        self.state_stamp = self.stat_state()
+        print_info('State restored', stream=self.output)
+        return True
+
+    def add_roots(self, patterns):
+        # all roots share one graph, so new ones get merged into the state
+        complete = [
+            a
+            for f in expand_roots(patterns, self.config['basedir'])
+            for a in self.detect_actions(os.path.normpath(f), False)
+        ]
+        for action in complete:
+            self.graph.merge(action)
+
+        # independent documents can compile side by side
+        for action in complete:
+            if isinstance(action, TexCompileAction):
+                get_equivalent(self.graph.actions, action).parallel = \
+                    self.config['parallel_roots']
+
+    def build(self):
+        self.acquire()
+        self.interrupted.clear()
+
+        # clear log?
+        if not self.config['append_log']:
+            open(self.abspath(self.config['log']), 'w').close()
+
+        with self.condition:
+            try:
+                return self.fixpoint()
+            except KeyboardInterrupt:
+                # keep the results of the actions that finished
+                print(file=self.output)
+                print_info('Interrupted', stream=self.output)
+                if self.lock.held():
+                    self.graph.save(self.abspath(self.config['state']))
+                    self.state_stamp = self.stat_state()
+                raise
+
+    def fixpoint(self):
+        # main loop (fixpoint iteration)
+        changed = True
+        rounds = 0
+        latency_start = None
+        while changed:
+            changed = self.collect_background()
+            with self.profiler.span('needs_update', 'checksum'):
+                ready = [
+                    a
+                    for a in self.graph
+                    if (a not in self.background) and a.needs_update(self)
+                ]
+            paths = self.graph.critical_paths()
+            schedule = sorted(ready, key=lambda a: (a.priority(), -paths[a]))
+
+            # background actions start when everything else is up to date
+            if all(a.background for a in schedule) and not self.previews():
+                for action in schedule:
+                    self.start_background(action)
+            schedule = [a for a in schedule if not a.background]
+
+            # update actions, parallel ones run as one batch
+            batch = [a for a in schedule if a.parallel]
+            for action in schedule:
+                if not action.parallel:
+                    novel = self.update_action(action)
+                elif action is batch[0]:
+                    novel = self.update_parallel(batch)
+                else:
+                    continue
+
+                # merge new actions to existing ones
+                for new in novel:
+                    self.graph.merge(new)
+
+                changed = True
+
+            # debug prints
+            if self.config['verbose']:
+                print_debug('', stream=self.output)
+                print_debug('Tracked commands:', stream=self.output)
+                for action in self.graph:
+                    print_debug(str(action), stream=self.output)
+                print_debug('', stream=self.output)
+
+            # safe state
+            if changed:
+                with self.profiler.span('save_state', 'state'):
+                    self.graph.save(self.abspath(self.config['state']))
+                self.state_stamp = self.stat_state()
+            elif self.config['continuously']:
+                if latency_start is not None:
+                    print_info('Latency: {:.3f}s'.format(
+                        time.time() - latency_start
+                    ), stream=self.output)
+                print_info('Sleep', False, stream=self.output)
+
+                # let other runs use the project while nothing happens
+                self.release()
+                with self.profiler.span('wait', 'inotify'):
+                    latency_start = self.wait_for_changes()
+                print_info('wake up!', True, True, stream=self.output)
+                self.acquire()
+                changed = True
+                rounds = 0
+                continue
+            elif self.background:
+                # the results of background actions are part of the build
+                while not self.background_done():
+                    self.idle(0.05)
+                changed = True
+                continue
+
+            rounds = rounds + 1
+            if (self.config['max_rounds'] != 0) \
+                    and (rounds > self.config['max_rounds']):
+                print_error('Reached maximum number of rounds!',
+                            stream=self.output)
+                return 1
+
+        # check status of all actions
+        if any(a.check_status() for a in self.graph):
+            print_error('There are some errors!', stream=self.output)
+            return 1
+
+        print_info('Done', stream=self.output)
+        return 0
+
+    def update_action(self, action):
+        with self.profiler.span(str(action), 'action'):
+            return action.update(self)
+
+    def update_parallel(self, actions):
+        jobs = self.config['jobs'] or os.cpu_count()
+        with concurrent.futures.ThreadPoolExecutor(jobs) as pool:
+            futures = [pool.submit(self.update_action, a) for a in actions]
+            try:
+                while not all(f.done() for f in futures):
+                    self.idle(0.05)
+            except KeyboardInterrupt:
+                # workers kill their child processes and stop
+                self.interrupted.set()
+                raise
+
+        # a failed action stays dirty, the others keep their results
+        novel = []
+        for action, future in zip(actions, futures):
+            try:
+                novel.extend(future.result())
+            except Exception as e:
+                print_error('{}: {}'.format(action, e), stream=self.output)
+        return novel
+
+    def start_background(self, action):
+        future = self.executor.submit(self.update_background, action)
+        future.add_done_callback(lambda f: self.notify())
+        self.background[action] = future
+
+    def update_background(self, action):
+        # the lock is released while the child process runs, so the graph
+        # only changes between the steps of other actions
+        with self.condition:
+            return self.update_action(action)
+
+    def background_done(self):
+        return any(f.done() for f in self.background.values())
+
+    def collect_background(self):
+        done = [
+            (action, future)
+            for action, future in self.background.items()
+            if future.done()
+        ]
+        for action, future in done:
+            del self.background[action]
+            try:
+                novel = future.result()
+            except KeyboardInterrupt:
+                # stopped by an interrupted parallel batch, stays dirty
+                continue
+            for new in novel:
+                self.graph.merge(new)
+
+            # inputs that changed after the last start need another run
+            if any(
+                    get_mtime(self.abspath(dep.path)) > action.started
+                    for dep in action.deps
+                    if isinstance(dep, FileAction)
+                    and (dep.path not in action.outputs)):
+                action.dirty = True
+        return bool(done)
+
+    def wait_for_changes(self):
+        files = dict(
+            (a.path, a)
+            for a in self.graph
+            if isinstance(a, FileAction)
+        )
+
+        # previews get completed when nothing happens for a while
+        deadline = None
+        if self.config['preview_idle'] > 0:
+            deadline = time.time() + self.config['preview_idle']
+
+        self.debounce.active = True
+        try:
+            return self.wait_for_burst(files, deadline)
+        finally:
+            self.debounce.active = False
+
+    def wait_for_burst(self, files, deadline=None):
+        while True:
+            while not self.dirty:
+                # finished background actions need a new round
+                if self.background_done():
+                    return None
+                if self.full_requested or ((deadline is not None)
+                                           and (time.time() >= deadline)):
+                    deadline = None
+                    if self.complete_previews():
+                        return None
+                print_info('.', False, True, stream=self.output)
+                self.condition.wait(
+                    None if deadline is None else deadline - time.time()
+                )
+
+            # let editors finish writing before looking at the files
+            remaining = self.debounce.remaining()
+            while remaining > 0:
+                self.condition.wait(remaining)
+                remaining = self.debounce.remaining()
+            start = self.debounce.finish_burst()
+
+            # only check files that were touched by this burst
+            dirty = list(self.dirty.keys())
+            self.dirty.clear()
+            changed = [
+                files[path]
+                for path in dirty
+                if (path in files) and files[path].needs_update(self)
+            ]
+            if self.config['verbose']:
+                print_debug(
+                    'Burst: {} paths, {} changed, quiet {:.3f}s'.format(
+                        len(dirty),
+                        len(changed),
+                        self.debounce.quiet_period()
+                    ),
+                    stream=self.output
+                )
+
+            if changed:
+                for faction in changed:
+                    faction.dirty = True
+                return start
+
+    def previewing(self):
+        return self.config['preview'] and self.config['continuously']
+
+    def drafting(self):
+        return self.previewing() and self.config['preview_drafts']
+
+    def request_full(self):
+        # safe to call from signal handlers and other threads
+        self.full_requested = True
+        self.notify()
+
+    def previews(self):
+        return [
+            a
+            for a in self.graph
+            if isinstance(a, TexCompileAction) and a.preview
+        ]
+
+    def complete_previews(self):
+        self.full_requested = False
+        previews = self.previews()
+        for action in previews:
+            action.preview = []
+            action.dirty = True
+        return bool(previews)
+
+    def idle(self, timeout):
+        # releases the lock, so the inotify thread can deliver events meanwhile
+        with self.condition:
+            self.condition.wait(timeout)
+
+    def notify(self):
+        with self.condition:
+            self.condition.notify_all()
+
+    def serve(self):
+        # requests always run until the fixpoint is reached
+        self.config['continuously'] = False
+
+        path = self.abspath(self.config['socket'])
+        if os.path.exists(path):
+            os.remove(path)
+
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as server:
+            server.bind(path)
+            server.listen(8)
+            print_info('Listening on ' + self.config['socket'],
+                       stream=self.output)
+            try:
+                while True:
+                    conn, _ = server.accept()
+                    with conn:
+                        try:
+                            self.handle_request(conn)
+                        except Exception as e:
+                            # a broken request must not stop the daemon
+                            print_error('Request failed: {!r}'.format(e),
+                                        stream=self.output)
+            except KeyboardInterrupt:
+                print(file=self.output)
+                print_info('Interrupted', stream=self.output)
+            finally:
+                os.remove(path)
+
+        return 0
+
+    def handle_request(self, conn):
+        # read request
+        unpacker = msgpack.Unpacker(encoding='utf-8')
+        request = None
+        while request is None:
+            data = conn.recv(4096)
+            if not data:
+                return
+            unpacker.feed(data)
+            request = next(unpacker, None)
+
+        # run build and stream progress back
+        stream = ClientStream(conn)
+        with self.condition:
+            self.output = stream
+            self.dirty.clear()
+            self.acquire()
+            try:
+                self.add_roots([
+                    os.path.relpath(f, self.config['basedir'])
+                    for f in request.get('files', [])
+                ])
+
+                if self.graph:
+                    status = self.build()
+                else:
+                    print_error('No matching action for this file!',
+                                stream=self.output)
+                    status = 1
+            except Exception as e:
+                print_error('Build failed: {!r}'.format(e), stream=self.output)
+                status = 1
+            finally:
+                self.release()
+                self.output = None
+        stream.send({'status': status})
 
 
 # =============================================================================
@@ -430,7 +2028,9 @@ RE_TRACELINE = re.compile(r"""
                            # additional infos (dropped)
     """, re.VERBOSE)
 
-STATE_VERSION = 2
+RE_WRITEFLAGS = re.compile(r"O_(WRONLY|RDWR|CREAT|TRUNC)")
+
+STATE_VERSION = 7
 
 TARGET_MAP = {
     'access':    0,
@@ -447,22 +2047,21 @@ TARGET_MAP = {
 
 TRACE_CMD = 'strace -e trace=file -f -qq -y -o'
 
+WRITE_MAP = {
+    'creat':     0,
+    'open':      0,
+    'openat':    1
+}
+
 YAML_PATCH = '?+'
 YAML_REMOVE = '?-'
 
-
-# =============================================================================
-# ================= GLOBALS ===================================================
-# =============================================================================
-TMPDIR = tempfile.TemporaryDirectory()
-
-INOTIFY_CONDITION = threading.Condition()
-
-INOTIFY_FILTER = set()
-
-CONFIG = {
+DEFAULT_CONFIG = {
     'append_log': False,
-    'basedir': os.path.abspath(os.getcwd()),
+    'basedir': None,
+    'cache': False,
+    'cache_dir': '~/.cache/autotex',
+    'cache_size': 1024,
     'command_map': {
         r"\.bcf": {
             'type': 'TexBibAction',
@@ -478,6 +2077,28 @@ CONFIG = {
             },
             'auto': False
         },
+        # the first converter whose source exists creates the PDF, the ones
+        # that execute scripts have to be enabled in the .autotexrc
+        r"\.pdf$": [
+            {
+                'type': 'EpsConvertAction',
+                'args': {
+                    'source': '?w.eps',
+                    'out': '?p'
+                },
+                'requires': '?w.eps',
+                'auto': True
+            },
+            {
+                'type': 'SvgConvertAction',
+                'args': {
+                    'source': '?w.svg',
+                    'out': '?p'
+                },
+                'requires': '?w.svg',
+                'auto': True
+            }
+        ],
         r"\.idx$": {
             'type': 'TexIndexAction',
             'args': {
@@ -490,12 +2111,28 @@ CONFIG = {
     },
     'continuously': False,
     'continuously_wait': 0.25,
+    'continuously_wait_factor': 2.0,
+    'continuously_wait_min': 0.02,
+    'daemon': False,
+    'jobs': 0,
+    'lock': 'wait',
     'log': 'autotex.log',
     'max_rounds': 10,
+    'parallel_roots': False,
+    'preempt': True,
+    'preempt_min_runtime': 1.0,
+    'preview': False,
+    'preview_drafts': False,
+    'preview_idle': 30.0,
     'print_stdout': False,
     'print_stderr': True,
+    'profile': None,
+    'profile_top': 10,
+    'publish': {},
+    'roots': [],
+    'socket': '.autotex.sock',
     'state': '.autotex.state',
-    'tmpdir': TMPDIR.name,
+    'tmpdir': None,
     'verbose': False
 }
 
@@ -503,24 +2140,16 @@ CONFIG = {
 # =============================================================================
 # ================= ORPHAN METHODS ============================================
 # =============================================================================
-def detect_actions(path, auto_only=True):
-    # find commands
-    commands = CONFIG['command_map'].items()
-    ok_auto = (
-        not auto_only or (('auto' in cmd) and (cmd['auto'] is True))
-        for ext, cmd in commands
-    )
+def detect_actions(path, command_map, auto_only=True, basedir=''):
+    # find commands, a list holds alternatives of which only one applies
+    commands = command_map.items()
     ok_path = (
         bool(re.search(ext, path))
         for ext, cmd in commands
     )
-    ok_all = (
-        all(t)
-        for t in zip(ok_auto, ok_path)
-    )
     commands_filtered = (
-        cmd
-        for (ext, cmd), o in zip(commands, ok_all)
+        cmd if type(cmd) == list else [cmd]
+        for (ext, cmd), o in zip(commands, ok_path)
         if o
     )
 
@@ -541,46 +2170,110 @@ def detect_actions(path, auto_only=True):
         for k in replace_dict.keys()
     ))
 
+    def substitute(value):
+        return pattern.sub(lambda x: replace_dict[x.group()], value)
+
     # find all matching commands
     actions = []
-    for cmd in commands_filtered:
-        # get action and args
-        actiontype = globals()[cmd['type']]
-        args = cmd['args'].copy() if 'args' in cmd else {}
-
-        # substitute string arguments
-        for key, value in args.items():
-            if type(value) == str:
-                args[key] = pattern.sub(
-                    lambda x: replace_dict[x.group()],
-                    value
-                )
-
-        # construct Action object
-        actions.append(actiontype(**args))
+    for alternatives in commands_filtered:
+        for cmd in alternatives:
+            if auto_only and not (('auto' in cmd) and (cmd['auto'] is True)):
+                continue
+
+            # only applies if the source files exist
+            requires = cmd.get('requires', [])
+            if type(requires) == str:
+                requires = [requires]
+            if not all(
+                os.path.exists(os.path.join(basedir, substitute(r)))
+                for r in requires
+            ):
+                continue
+
+            # get action and args
+            actiontype = globals()[cmd['type']]
+            args = cmd['args'].copy() if 'args' in cmd else {}
+
+            # substitute string arguments
+            for key, value in args.items():
+                if type(value) == str:
+                    args[key] = substitute(value)
+
+            # construct Action object, the first usable alternative wins
+            actions.append(actiontype(**args))
+            break
 
     return actions
 
 
-def analyze_trace(tracefile):
+def analyze_trace(tracefile, basedir, cwd=''):
     matches = (
         RE_TRACELINE.search(l)
         for l in tracefile
     )
-    parsed = (
+    parsed = [
         (m.group('func'), m.group('args').split(', '))
         for m in matches
         if m
-    )
+    ]
     targets = (
-        os.path.abspath(args[TARGET_MAP[func]].replace('"', ''))
+        args[TARGET_MAP[func]]
         for func, args in parsed
         if func in TARGET_MAP
     )
+    written = (
+        args[WRITE_MAP[func]]
+        for func, args in parsed
+        if (func in WRITE_MAP) and is_write(func, args)
+    )
+    return (
+        local_paths(targets, basedir, cwd),
+        local_paths(written, basedir, cwd)
+    )
+
+
+def is_write(func, args):
+    if func == 'creat':
+        return True
+    flags = WRITE_MAP[func] + 1
+    return (len(args) > flags) and bool(RE_WRITEFLAGS.search(args[flags]))
+
+
+def includeonly_args(path, chapters):
+    # the job needs a name, LaTeX reads its first line from the command line
+    cwd, name = os.path.split(path)
+    only = ','.join(os.path.relpath(c, cwd or '.') for c in chapters)
+    return '-jobname={} {}'.format(
+        os.path.splitext(name)[0],
+        shlex.quote('\\includeonly{' + only + '}\\input{' + name + '}')
+    )
+
+
+def pdfmark_string(value):
+    if type(value) == list:
+        value = ', '.join(str(v) for v in value)
+    value = str(value)
+    try:
+        value.encode('ascii')
+    except UnicodeEncodeError:
+        # everything else needs UTF-16 with byte order mark
+        encoded = binascii.hexlify(value.encode('utf-16-be'))
+        return '<FEFF' + str(encoded, 'utf8').upper() + '>'
+    escaped = value.replace('\\', '\\\\') \
+        .replace('(', '\\(') \
+        .replace(')', '\\)')
+    return '(' + escaped + ')'
+
+
+def local_paths(paths, basedir, cwd=''):
+    abspaths = (
+        os.path.abspath(os.path.join(basedir, cwd, p.replace('"', '')))
+        for p in paths
+    )
     return set(
-        os.path.relpath(t)
-        for t in targets
-        if os.path.commonprefix([CONFIG['basedir'], t]) == CONFIG['basedir']
+        os.path.relpath(t, basedir)
+        for t in abspaths
+        if os.path.commonprefix([basedir, t]) == basedir
     )
 
 
@@ -645,101 +2338,75 @@ def patch_dict(orig, patch):
     return result
 
 
-def print_master(msg, marker, newline, append):
+def print_master(msg, marker, newline, append, stream):
+    # one write, so lines of parallel actions do not get mixed up
     if not append:
-        sys.stdout.write('[{}] '.format(marker))
-    sys.stdout.write(msg)
+        msg = '[{}] {}'.format(marker, msg)
     if newline:
-        print()
-    sys.stdout.flush()
-
-
-def print_info(msg, newline=True, append=False):
-    print_master(msg, 'i', newline, append)
-
+        msg = msg + '\n'
+    stream = stream or sys.stdout
+    stream.write(msg)
+    stream.flush()
 
-def print_changed(msg, newline=True, append=False):
-    print_master(msg, '~', newline, append)
 
+def print_info(msg, newline=True, append=False, stream=None):
+    print_master(msg, 'i', newline, append, stream)
 
-def print_execute(msg, newline=True, append=False):
-    print_master(msg, '+', newline, append)
 
+def print_changed(msg, newline=True, append=False, stream=None):
+    print_master(msg, '~', newline, append, stream)
 
-def print_error(msg, newline=True, append=False):
-    print_master(msg, 'X', newline, append)
 
+def print_execute(msg, newline=True, append=False, stream=None):
+    print_master(msg, '+', newline, append, stream)
 
-def print_debug(msg, newline=True, append=False):
-    print_master(msg, '.', newline, append)
 
+def print_error(msg, newline=True, append=False, stream=None):
+    print_master(msg, 'X', newline, append, stream)
 
-def restore_state():
-    # load data from file
-    with gzip.open(CONFIG['state'], 'rb') as statefile:
-        state = msgpack.unpackb(statefile.read(), encoding='utf-8')
 
-    # version check
-    if 'state_version' not in state \
-            or state['state_version'] != STATE_VERSION:
-        raise Exception('Incompatible state version!')
+def print_debug(msg, newline=True, append=False, stream=None):
+    print_master(msg, '.', newline, append, stream)
 
-    # create objects
-    actions = state['actions']
-    table = {}
-    for j in actions:
-        actiontype = globals()[j['type']]
-        obj = actiontype.__new__(actiontype)
-        obj.from_json(j)
-        table[j['id']] = obj
 
-    # restore dependency graph
-    for j in actions:
-        action = table[j['id']]
-        action.deps.update(table[y] for y in j['deps'])
-        action.influences.update(table[y] for y in j['influences'])
-
-    print_info('State restored')
-    return set(table.values())
-
-
-def initialize_state(files):
-    complete = (a for f in files for a in detect_actions(f, False))
-    actions = set()
-
-    for action in complete:
-        if action in actions:
-            get_equivalent(actions, action).merge(action)
+def expand_roots(patterns, basedir):
+    roots = []
+    for pattern in patterns:
+        if glob.has_magic(pattern):
+            roots.extend(sorted(set(
+                os.path.relpath(p, basedir)
+                for p in glob_recursive(os.path.join(basedir, pattern))
+            )))
         else:
-            actions.add(action)
-
-    return actions
-
-
-def save_state(actions):
-    # build state
-    state = {
-        'state_version': STATE_VERSION,
-        'actions': [a.to_json() for a in actions]
-    }
+            roots.append(pattern)
+    return roots
+
+
+def glob_recursive(pattern):
+    # glob.glob only understands ** since Python 3.5
+    head, sep, tail = pattern.partition(os.sep + '**' + os.sep)
+    if not sep:
+        return glob.glob(pattern)
+
+    result = []
+    for top in glob.glob(head):
+        for dirpath, dirnames, filenames in os.walk(top):
+            # hidden folders are skipped like by glob
+            dirnames[:] = [d for d in dirnames if not d.startswith('.')]
+            result.extend(glob_recursive(os.path.join(dirpath, tail)))
+    return result
 
-    # write to temporary file
-    state_tmp = CONFIG['state'] + '.new'
-    with gzip.GzipFile(
-        filename=CONFIG['state'],
-        fileobj=open(state_tmp, 'wb')
-    ) as statefile:
-        statefile.write(msgpack.packb(state, use_bin_type=True))
-        statefile.flush()
-        os.fsync(statefile)
 
-    # finally overwrite old file
-    shutil.move(state_tmp, CONFIG['state'])
+def daemon_running(path):
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        try:
+            sock.connect(path)
+            return True
+        except OSError:
+            return False
 
 
 def main():
-    global CONFIG
-
     # parse command line arguments
     parser = argparse.ArgumentParser(
         description='Compiles .tex files to PDFs using LuaLaTeX'
@@ -771,6 +2438,50 @@ def main():
         default=None,
         help='Update build continuously'
     )
+    parser.add_argument(
+        '--daemon', '-d',
+        action='store_true',
+        default=None,
+        help='Keep running and serve build requests of autotex-client'
+    )
+    parser.add_argument(
+        '--jobs', '-j',
+        type=int,
+        help='Number of parallel conversions (0 => number of CPUs)'
+    )
+    parser.add_argument(
+        '--lock',
+        choices=['attach', 'fail', 'wait'],
+        help='What to do when another autotex run works on the project'
+    )
+    parser.add_argument(
+        '--parallel-roots',
+        action='store_true',
+        default=None,
+        help='Compile the root documents in parallel'
+    )
+    parser.add_argument(
+        '--preview',
+        action='store_true',
+        default=None,
+        help='Compile changed chapters only in continues mode'
+    )
+    parser.add_argument(
+        '--profile', '-p',
+        type=str,
+        help='Write timing spans to this Chrome trace (JSON) file'
+    )
+    parser.add_argument(
+        '--socket',
+        type=str,
+        help='UNIX socket used by the daemon'
+    )
+    parser.add_argument(
+        '--workspace', '-w',
+        dest='roots',
+        action='append',
+        help='Glob pattern of additional root files (workspace mode)'
+    )
     parser.add_argument(
         '--state', '-s',
         type=str,
@@ -783,127 +2494,79 @@ def main():
         help='verbose output'
     )
     args = parser.parse_args()
-    if not args.files:
-        args.files = None
 
     # generate config
+    config = DEFAULT_CONFIG
     try:
-        with open(args.CONFIG) as configfile:
-            CONFIG = patch_dict(CONFIG, yaml.load(configfile.read()))
-    except Exception:
+        with open(args.config) as configfile:
+            config = patch_dict(
+                config,
+                yaml.safe_load(configfile.read()) or {}
+            )
+    except FileNotFoundError:
         pass
-    CONFIG = patch_dict(CONFIG, vars(args))
+    builder = Builder(patch_dict(config, vars(args)))
+    config = builder.config
 
-    # clear log?
-    if not CONFIG['append_log']:
-        open(CONFIG['log'], 'w').close()
+    # a daemon can only serve one project at a time
+    socket_path = builder.abspath(config['socket'])
+    if config['daemon'] and daemon_running(socket_path):
+        print_error('Daemon already running at ' + config['socket'])
+        exit(1)
 
-    # try to restore or initialize state
-    try:
-        actions = restore_state()
-    except Exception:
-        if 'files' in CONFIG:
-            actions = initialize_state(CONFIG['files'])
-        else:
-            parser.print_usage()
+    # let a running daemon do the work
+    if (config['lock'] == 'attach') and not config['daemon'] \
+            and daemon_running(socket_path):
+        print_info('Attaching to daemon at ' + config['socket'])
+        status = client.request(socket_path, args.files)
+        exit(2 if status is None else status)
+
+    with builder:
+        if not builder.acquire(config['lock'] != 'fail'):
+            print_error('Project is locked by autotex (pid {})'.format(
+                builder.lock.holder()
+            ))
             exit(1)
 
-    if not actions:
-        print_error('No matching action for this file!')
-        exit(1)
-
-    # setup inotify
-    mask = pyinotify.EventsCodes.ALL_FLAGS['IN_ATTRIB'] \
-        | pyinotify.EventsCodes.ALL_FLAGS['IN_CLOSE_WRITE'] \
-        | pyinotify.EventsCodes.ALL_FLAGS['IN_CREATE'] \
-        | pyinotify.EventsCodes.ALL_FLAGS['IN_DELETE'] \
-        | pyinotify.EventsCodes.ALL_FLAGS['IN_DELETE_SELF'] \
-        | pyinotify.EventsCodes.ALL_FLAGS['IN_MODIFY'] \
-        | pyinotify.EventsCodes.ALL_FLAGS['IN_MOVE_SELF'] \
-        | pyinotify.EventsCodes.ALL_FLAGS['IN_MOVED_FROM'] \
-        | pyinotify.EventsCodes.ALL_FLAGS['IN_MOVED_TO']
-    watch_manager = pyinotify.WatchManager()
-    notifier = pyinotify.ThreadedNotifier(watch_manager, INotifyHandler())
-    # double with to avoid crashing pylint
-    with contextlib.ExitStack() as stack:
-        with INOTIFY_CONDITION:
-            stack.callback(notifier.stop)
-            notifier.start()
-            watch_manager.add_watch(
-                CONFIG['basedir'],
-                mask,
-                rec=True
-            )
+        # try to restore or initialize state
+        roots = config['roots'] + [
+            os.path.relpath(os.path.abspath(f), config['basedir'])
+            for f in args.files
+        ]
+        if not builder.restore() and not roots and not config['daemon']:
+            parser.print_usage()
+            exit(1)
 
-            # main loop (fixpoint iteration)
-            changed = True
-            rounds = 0
-            terminate = False
-            while changed and not terminate:
-                changed = False
-                schedule = sorted((a for a in actions if a.needs_update()),
-                                  key=operator.methodcaller('priority'))
+        builder.add_roots(roots)
+        if config['roots']:
+            print_info('Workspace: {} commands'.format(
+                len(builder.graph.commands())
+            ))
 
-                try:
-                    # update actions
-                    for action in schedule:
-                        novel = action.update()
-
-                        # merge new actions to existing ones
-                        for new in novel:
-                            if new in actions:
-                                get_equivalent(actions, new).merge(new)
-                            else:
-                                actions.add(new)
-
-                        changed = True
-                except KeyboardInterrupt:
-                    signal.signal(signal.SIGINT, signal.SIG_IGN)
-                    print()
-                    print_info('Interrupted')
-                    terminate = True
-
-                # debug prints
-                if CONFIG['verbose']:
-                    print_debug('')
-                    print_debug('Tracked commands:')
-                    for action in actions:
-                        print_debug(str(action))
-                    print_debug('')
-
-                # safe state
-                if changed:
-                    save_state(actions)
-                elif CONFIG['continuously'] and not terminate:
-                    print_info('Sleep', False)
-                    try:
-                        while not any(a.needs_update() for a in actions):
-                            print_info('.', False, True)
-                            INOTIFY_CONDITION.wait()
-                            time.sleep(CONFIG['continuously_wait'])
-                        print_info('wake up!', True, True)
-                        changed = True
-                        rounds = 0
-                    except KeyboardInterrupt:
-                        signal.signal(signal.SIGINT, signal.SIG_IGN)
-                        print()
-                        print_info('Interrupted')
-                        terminate = True
-                    continue
+        if not builder.graph and not config['daemon']:
+            print_error('No matching action for this file!')
+            exit(1)
 
-                rounds = rounds + 1
-                if (CONFIG['max_rounds'] != 0) \
-                        and (rounds > CONFIG['max_rounds']) \
-                        and not terminate:
-                    print_error('Reached maximum number of rounds!')
-                    exit(1)
+        if config['daemon']:
+            # the daemon only locks the project while serving requests
+            builder.release()
+            status = builder.serve()
+        else:
+            # SIGUSR1 completes previews on demand
+            signal.signal(
+                signal.SIGUSR1,
+                lambda signum, frame: builder.request_full()
+            )
+            try:
+                status = builder.build()
+            except KeyboardInterrupt:
+                status = 1
 
-    # check status of all actions
-    if any(a.check_status() for a in actions):
-        print_error('There are some errors!')
-        exit(1)
+        # a second Ctrl+C must not abort the cleanup
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
 
-    print_info('Done')
+    if status:
+        exit(status)
 
 if __name__ == '__main__':
     main()
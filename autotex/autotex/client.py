@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+
+import argparse
+import msgpack
+import os
+import os.path
+import socket
+import sys
+
+
+def request(path, files):
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(path)
+        sock.sendall(msgpack.packb(
+            {'files': [os.path.abspath(f) for f in files]},
+            use_bin_type=True
+        ))
+
+        # stream progress until the daemon reports the build status
+        unpacker = msgpack.Unpacker(encoding='utf-8')
+        while True:
+            data = sock.recv(4096)
+            if not data:
+                return None
+            unpacker.feed(data)
+            for message in unpacker:
+                if 'out' in message:
+                    sys.stdout.write(message['out'])
+                    sys.stdout.flush()
+                if 'status' in message:
+                    return message['status']
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Sends build requests to a running autotex daemon'
+    )
+    parser.add_argument(
+        'files',
+        nargs='*',
+        help='additional initial processed files'
+    )
+    parser.add_argument(
+        '--socket',
+        type=str,
+        default='.autotex.sock',
+        help='UNIX socket of the daemon'
+    )
+    args = parser.parse_args()
+
+    try:
+        status = request(args.socket, args.files)
+    except OSError:
+        sys.stdout.write('[X] No autotex daemon running at {}\n'.format(
+            args.socket
+        ))
+        exit(2)
+
+    if status is None:
+        sys.stdout.write('[X] Connection to daemon lost\n')
+        exit(2)
+    exit(status)
+
+
+if __name__ == '__main__':
+    main()
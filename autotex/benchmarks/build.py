@@ -0,0 +1,303 @@
+#!/usr/bin/env python3
+
+import argparse
+import json
+import os
+import os.path
+import re
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+BENCHDIR = os.path.dirname(os.path.abspath(__file__))
+FAKE_TEX = os.path.join(BENCHDIR, 'fake_tex.py')
+PACKAGEDIR = os.path.join(BENCHDIR, os.pardir)
+
+SCENARIOS = ['cold', 'warm', 'changed', 'watch']
+
+
+# =============================================================================
+# ================= PROJECT ===================================================
+# =============================================================================
+def generate_project(path, chapters, passes, cpu):
+    os.makedirs(path)
+
+    # document graph: main file, chapters, shared snippets, bib and index
+    with open(os.path.join(path, 'main.tex'), 'w') as fmain:
+        fmain.write('%fake:bib\n%fake:index\n')
+        for i in range(chapters):
+            fmain.write('\\include{{chapter{}}}\n'.format(i))
+    for i in range(chapters):
+        with open(os.path.join(path, 'chapter{}.tex'.format(i)), 'w') as f:
+            f.write('Text of chapter {}.\n'.format(i))
+            f.write('\\input{{snippets/snippet{}}}\n'.format(i % 5))
+    os.makedirs(os.path.join(path, 'snippets'))
+    for i in range(min(chapters, 5)):
+        with open(os.path.join(path, 'snippets', 'snippet{}.tex'.format(i)),
+                  'w') as f:
+            f.write('Shared snippet {}.\n'.format(i))
+
+    # plug the fake engine into the command_map
+    engine = '{} {} --passes {} --cpu {}'.format(
+        sys.executable,
+        FAKE_TEX,
+        passes,
+        cpu
+    )
+    config = {
+        'command_map': {
+            r"\.bcf$": {
+                'type': 'CommandAction',
+                'args': {'command': engine + ' --mode bib ?p'},
+                'auto': True
+            },
+            r"\.idx$": {
+                'type': 'CommandAction',
+                'args': {'command': engine + ' --mode index ?p'},
+                'auto': True
+            },
+            r"\.tex$": {
+                'type': 'CommandAction',
+                'args': {
+                    'command': engine + ' ?p',
+                    'ignores': [r"\.log$", r"\.pdf$"]
+                },
+                'auto': False
+            }
+        },
+        # bib and index feedback can take more rounds than the default limit
+        'max_rounds': 0
+    }
+    with open(os.path.join(path, '.autotexrc'), 'w') as fconfig:
+        json.dump(config, fconfig, indent=2)  # JSON is valid YAML
+
+
+def clean_project(path):
+    for name in os.listdir(path):
+        if os.path.splitext(name)[1] in ['.aux', '.bbl', '.bcf', '.idx',
+                                         '.ind', '.log', '.pdf', '.state']:
+            os.remove(os.path.join(path, name))
+
+
+# =============================================================================
+# ================= RUNNER ====================================================
+# =============================================================================
+def autotex_cmd(extra):
+    return [sys.executable, '-m', 'autotex', '-v'] + extra + ['main.tex']
+
+
+def autotex_env(stats):
+    env = os.environ.copy()
+    env['PYTHONPATH'] = PACKAGEDIR + os.pathsep + env.get('PYTHONPATH', '')
+    env['FAKE_TEX_STATS'] = stats
+    return env
+
+
+def engine_time(stats):
+    try:
+        with open(stats) as statsfile:
+            times = [float(line) for line in statsfile if line.strip()]
+    except IOError:
+        times = []
+    if os.path.exists(stats):
+        os.remove(stats)
+    return times
+
+
+def summarize(scenario, chapters, output, wall, engine):
+    return {
+        'scenario': scenario,
+        'chapters': chapters,
+        'wall': wall,
+        'rounds': output.count('Tracked commands:'),
+        'runs': len(re.findall(r"^\[\+\]", output, re.MULTILINE)),
+        'engine': engine,
+        'overhead': wall - engine
+    }
+
+
+def run_build(project, stats):
+    start = time.perf_counter()
+    proc = subprocess.Popen(
+        autotex_cmd([]),
+        cwd=project,
+        env=autotex_env(stats),
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        universal_newlines=True
+    )
+    output = proc.communicate()[0]
+    wall = time.perf_counter() - start
+    if proc.returncode != 0:
+        raise RuntimeError('autotex failed:\n' + output)
+    return output, wall
+
+
+def run_watch(project, stats, timeout):
+    proc = subprocess.Popen(
+        autotex_cmd(['-e']),
+        cwd=project,
+        env=autotex_env(stats),
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        universal_newlines=True
+    )
+    output = []
+    reader = threading.Thread(
+        target=lambda: output.extend(iter(lambda: proc.stdout.read(1), ''))
+    )
+    reader.start()
+
+    def wait_for(pattern, offset):
+        end = time.perf_counter() + timeout
+        while time.perf_counter() < end:
+            match = re.compile(pattern).search(''.join(output), offset)
+            if match:
+                return match
+            if proc.poll() is not None:
+                raise RuntimeError('autotex failed:\n' + ''.join(output))
+            time.sleep(0.01)
+        raise RuntimeError('timeout while waiting for ' + pattern)
+
+    try:
+        # initial build, then change one chapter and wait for the rebuild
+        sleep = wait_for(r"Sleep", 0)
+        engine_time(stats)
+        start = time.perf_counter()
+        with open(os.path.join(project, 'chapter0.tex'), 'a') as f:
+            f.write('Edited in watch mode.\n')
+        latency = wait_for(r"Latency: ([0-9.]+)s", sleep.end())
+        wall = time.perf_counter() - start
+        wait_for(r"Sleep", latency.end())
+    finally:
+        proc.send_signal(signal.SIGINT)
+        proc.wait()
+        reader.join()
+
+    text = ''.join(output)
+    return text[sleep.end():latency.end()], wall, float(latency.group(1))
+
+
+def run_scenarios(chapters, scenarios, passes, cpu, timeout):
+    results = []
+    with tempfile.TemporaryDirectory() as tmpdir:
+        project = os.path.join(tmpdir, 'project')
+        stats = os.path.join(tmpdir, 'engine.stats')
+        generate_project(project, chapters, passes, cpu)
+
+        for scenario in scenarios:
+            if scenario == 'cold':
+                clean_project(project)
+            elif scenario == 'changed':
+                with open(os.path.join(project, 'chapter0.tex'), 'a') as f:
+                    f.write('One more line.\n')
+
+            latency = None
+            if scenario == 'watch':
+                output, wall, latency = run_watch(project, stats, timeout)
+            else:
+                output, wall = run_build(project, stats)
+            times = engine_time(stats)
+            result = summarize(scenario, chapters, output, wall, sum(times))
+
+            # otherwise the real engine got timed as overhead
+            if result['runs'] and not times:
+                raise RuntimeError(
+                    '{}: autotex ran commands, but the fake engine recorded '
+                    'no runs, was the .autotexrc ignored?'.format(scenario)
+                )
+            result['latency'] = latency
+            results.append(result)
+            print('{:8} {:>8} {:8.3f}s {:>6} {:>6} {:8.3f}s {:8.3f}s'.format(
+                scenario,
+                chapters,
+                result['wall'],
+                result['rounds'],
+                result['runs'],
+                result['engine'],
+                result['overhead']
+            ))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='End-to-end autotex builds using a fake TeX engine',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter
+    )
+    parser.add_argument(
+        '--sizes',
+        type=str,
+        default='1,10,50',
+        help='Comma separated number of chapters per project'
+    )
+    parser.add_argument(
+        '--scenarios',
+        type=str,
+        default=','.join(SCENARIOS),
+        help='Comma separated scenarios'
+    )
+    parser.add_argument(
+        '--passes',
+        type=int,
+        default=2,
+        help='Passes until the fake engine converges'
+    )
+    parser.add_argument(
+        '--cpu',
+        type=float,
+        default=0.05,
+        help='CPU time per fake engine run (seconds)'
+    )
+    parser.add_argument(
+        '--timeout',
+        type=float,
+        default=120.0,
+        help='Timeout for watch mode events (seconds)'
+    )
+    parser.add_argument(
+        '--output', '-o',
+        type=str,
+        help='Write results to this JSON file'
+    )
+    args = parser.parse_args()
+
+    if not shutil.which('strace'):
+        print('strace is required but was not found!')
+        exit(1)
+
+    scenarios = args.scenarios.split(',')
+    unknown = set(scenarios).difference(SCENARIOS)
+    if unknown:
+        parser.error('unknown scenarios: ' + ', '.join(sorted(unknown)))
+
+    print('{:8} {:>8} {:>9} {:>6} {:>6} {:>9} {:>9}'.format(
+        'scenario',
+        'chapters',
+        'wall',
+        'rounds',
+        'runs',
+        'engine',
+        'overhead'
+    ))
+    results = []
+    for size in [int(x) for x in args.sizes.split(',')]:
+        results.extend(run_scenarios(
+            size,
+            scenarios,
+            args.passes,
+            args.cpu,
+            args.timeout
+        ))
+
+    if args.output:
+        with open(args.output, 'w') as outfile:
+            json.dump({'results': results}, outfile, indent=2)
+
+
+if __name__ == '__main__':
+    main()
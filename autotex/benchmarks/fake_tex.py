@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+
+import argparse
+import hashlib
+import os
+import os.path
+import re
+import time
+
+RE_INCLUDE = re.compile(r"\\(?:input|include)\{([^}]+)\}")
+
+
+def read(path):
+    try:
+        with open(path) as infile:
+            return infile.read()
+    except IOError:
+        return None
+
+
+def write(path, content):
+    with open(path, 'w') as outfile:
+        outfile.write(content)
+
+
+def burn(seconds):
+    # busy loop, so the engine shows up as CPU time like a real one
+    end = time.process_time() + seconds
+    while time.process_time() < end:
+        pass
+
+
+def collect(path, hasher, flags, seen):
+    if not path.endswith('.tex'):
+        path = path + '.tex'
+    if path in seen:
+        return
+    seen.add(path)
+
+    content = read(path)
+    if content is None:
+        return
+    hasher.update(content.encode('utf8'))
+    for line in content.splitlines():
+        if line.startswith('%fake:'):
+            flags.add(line[len('%fake:'):].strip())
+    for include in RE_INCLUDE.findall(content):
+        collect(include, hasher, flags, seen)
+
+
+def run_tex(path, passes):
+    jobname = os.path.splitext(os.path.basename(path))[0]
+    hasher = hashlib.sha256()
+    flags = set()
+    collect(path, hasher, flags, set())
+    sources = hasher.hexdigest()
+
+    # processed bib and index data feed back into the next pass
+    for ext in ['.bbl', '.ind']:
+        hasher.update((read(jobname + ext) or '').encode('utf8'))
+    digest = hasher.hexdigest()
+
+    # the aux file converges after the configured number of passes
+    aux = read(jobname + '.aux') or ''
+    match = re.search(r"% pass (\d+) of (\w+)", aux)
+    done = int(match.group(1)) if match and match.group(2) == digest else 0
+    write(
+        jobname + '.aux',
+        '% pass {} of {}\n'.format(min(done + 1, passes), digest)
+    )
+
+    if 'bib' in flags:
+        write(jobname + '.bcf', 'bib data of {}\n'.format(sources))
+    if 'index' in flags:
+        write(jobname + '.idx', 'index data of {}\n'.format(sources))
+    write(jobname + '.log', 'fake engine, pass {}\n'.format(done + 1))
+    write(jobname + '.pdf', 'PDF of {} after pass {}\n'.format(
+        digest,
+        min(done + 1, passes)
+    ))
+
+
+def run_processor(path, ext):
+    content = read(path) or ''
+    write(
+        os.path.splitext(path)[0] + ext,
+        'processed {}\n'.format(hashlib.sha256(content.encode()).hexdigest())
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Stand-in for TeX engines, biber and makeindex that '
+        'reads include files and writes converging outputs'
+    )
+    parser.add_argument(
+        'file',
+        help='Input file'
+    )
+    parser.add_argument(
+        '--mode',
+        choices=['tex', 'bib', 'index'],
+        default='tex',
+        help='Which tool to simulate'
+    )
+    parser.add_argument(
+        '--passes',
+        type=int,
+        default=2,
+        help='Passes until the .aux file converges'
+    )
+    parser.add_argument(
+        '--cpu',
+        type=float,
+        default=0.1,
+        help='CPU time burned per run (seconds)'
+    )
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    burn(args.cpu)
+    if args.mode == 'tex':
+        run_tex(args.file, args.passes)
+    elif args.mode == 'bib':
+        run_processor(args.file, '.bbl')
+    else:
+        run_processor(args.file, '.ind')
+
+    # let the harness separate engine time from autotex overhead
+    stats = os.environ.get('FAKE_TEX_STATS')
+    if stats:
+        with open(stats, 'a') as statsfile:
+            statsfile.write('{}\n'.format(time.perf_counter() - start))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,297 @@
+#!/usr/bin/env python3
+
+import argparse
+import io
+import json
+import math
+import os
+import os.path
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(
+    0,
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+)
+import autotex  # noqa: E402
+
+
+# =============================================================================
+# ================= GENERATORS ================================================
+# =============================================================================
+TRACE_LINES = [
+    '{pid} openat(AT_FDCWD, "{path}", O_RDONLY|O_CLOEXEC) = 3</x/{path}>',
+    '{pid} openat(AT_FDCWD, "{path}", O_WRONLY|O_CREAT|O_TRUNC, 0666) = 4',
+    '{pid} stat("{path}", {{st_mode=S_IFREG|0644, st_size=42}}) = 0',
+    '{pid} access("{path}", R_OK) = 0',
+    '{pid} readlink("/usr/share/{path}", 0x7ffd, 4096) = -1 EINVAL',
+    '{pid} execve("/usr/bin/lualatex", ["lualatex"], 0x7ffd /* 4 */) = 0',
+    '{pid} --- SIGCHLD {{si_signo=SIGCHLD, si_code=CLD_EXITED}} ---',
+]
+
+
+def generate_trace(size, rng):
+    lines = []
+    for i in range(size):
+        template = TRACE_LINES[rng.randrange(len(TRACE_LINES))]
+        lines.append(template.format(
+            pid=1000 + (i % 7),
+            path='chapter{}/file{}.tex'.format(i % 13, i % 997)
+        ))
+    return '\n'.join(lines) + '\n'
+
+
+def generate_graph(size, rng):
+    files = [
+        autotex.FileAction('dir{}/file{}.tex'.format(i % 17, i))
+        for i in range(size)
+    ]
+    commands = [
+        autotex.CommandAction('lualatex doc{}.tex'.format(i))
+        for i in range(max(1, size // 10))
+    ]
+    for command in commands:
+        for faction in rng.sample(files, min(len(files), 20)):
+            command.add_dependency(faction)
+        command.outputs = ['doc{}.aux'.format(rng.randrange(size))]
+    return files, commands
+
+
+def generate_command_map(size):
+    return dict(
+        (
+            r"\.ext{}$".format(i),
+            {
+                'type': 'CommandAction',
+                'args': {
+                    'command': 'tool{} ?p ?w.out ?d ?b ?e ??'.format(i)
+                },
+                'auto': i % 2 == 0
+            }
+        )
+        for i in range(size)
+    )
+
+
+def generate_patch(depth, width):
+    if depth == 0:
+        return dict(('key{}'.format(i), i) for i in range(width))
+    patch = dict(
+        ('?+node{}'.format(i), generate_patch(depth - 1, width))
+        for i in range(width)
+    )
+    patch['?-key0'] = None
+    patch['removed'] = '?-'
+    return patch
+
+
+# =============================================================================
+# ================= BENCHMARKS ================================================
+# =============================================================================
+def measure(func, repeat):
+    # best of several runs, the minimum is the least noisy estimate
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        duration = time.perf_counter() - start
+        best = duration if best is None else min(best, duration)
+    return best
+
+
+def bench_analyze_trace(size, rng, tmpdir):
+    trace = generate_trace(size, rng)
+    return lambda: autotex.analyze_trace(io.StringIO(trace), tmpdir)
+
+
+def bench_detect_actions(size, rng, tmpdir):
+    command_map = generate_command_map(size)
+    paths = ['dir/file.ext{}'.format(rng.randrange(size)) for _ in range(50)]
+    return lambda: [
+        autotex.detect_actions(p, command_map, False)
+        for p in paths
+    ]
+
+
+def bench_get_equivalent(size, rng, tmpdir):
+    files, commands = generate_graph(size, rng)
+    container = set(files + commands)
+    probes = [
+        autotex.FileAction(f.path)
+        for f in rng.sample(files, min(len(files), 50))
+    ]
+    return lambda: [autotex.get_equivalent(container, p) for p in probes]
+
+
+def bench_merge(size, rng, tmpdir):
+    files, commands = generate_graph(size, rng)
+
+    def run():
+        graph = autotex.Graph(dict((a, a) for a in files + commands))
+        for faction in files:
+            new = autotex.FileAction(faction.path)
+            new.add_dependency(autotex.FileAction(faction.path + '.dep'))
+            graph.merge(new)
+    return run
+
+
+def bench_patch_dict(size, rng, tmpdir):
+    # about size leaves in a tree of fan-out 4
+    depth = max(1, round(math.log(size, 4)))
+    orig = generate_patch(depth, 4)
+    patch = generate_patch(depth, 4)
+    return lambda: autotex.patch_dict(orig, patch)
+
+
+def bench_save_state(size, rng, tmpdir):
+    files, commands = generate_graph(size, rng)
+    graph = autotex.Graph(dict((a, a) for a in files + commands))
+    path = os.path.join(tmpdir, 'bench.state')
+    return lambda: graph.save(path)
+
+
+def bench_restore_state(size, rng, tmpdir):
+    bench_save_state(size, rng, tmpdir)()
+    path = os.path.join(tmpdir, 'bench.state')
+    return lambda: autotex.Graph.load(path)
+
+
+def bench_calc_file_checksum(size, rng, tmpdir):
+    builder = autotex.Builder({'basedir': tmpdir})
+    with open(os.path.join(tmpdir, 'bench.bin'), 'wb') as binfile:
+        binfile.write(os.urandom(size * 1024))
+    return lambda: autotex.FileAction('bench.bin').calc_file_checksum(builder)
+
+
+BENCHMARKS = [
+    # name, function, unit of size
+    ('analyze_trace', bench_analyze_trace, 'lines'),
+    ('detect_actions', bench_detect_actions, 'map entries'),
+    ('get_equivalent', bench_get_equivalent, 'files'),
+    ('merge', bench_merge, 'files'),
+    ('patch_dict', bench_patch_dict, 'leaves'),
+    ('save_state', bench_save_state, 'files'),
+    ('restore_state', bench_restore_state, 'files'),
+    ('calc_file_checksum', bench_calc_file_checksum, 'KiB'),
+]
+
+
+def run_benchmarks(names, sizes, repeat):
+    results = []
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for name, factory, unit in BENCHMARKS:
+            if names and name not in names:
+                continue
+            for size in sizes:
+                func = factory(size, random.Random(size), tmpdir)
+                seconds = measure(func, repeat)
+                results.append({
+                    'name': name,
+                    'size': size,
+                    'unit': unit,
+                    'seconds': seconds
+                })
+                print('{:20} {:>8} {:12} {:12.6f}s'.format(
+                    name,
+                    size,
+                    unit,
+                    seconds
+                ))
+    return results
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            stderr=subprocess.DEVNULL,
+            universal_newlines=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline_path):
+    with open(baseline_path) as infile:
+        baseline = dict(
+            ((r['name'], r['size']), r['seconds'])
+            for r in json.load(infile)['results']
+        )
+
+    print('')
+    print('Comparison with ' + baseline_path + ' (new / old):')
+    for result in results:
+        old = baseline.get((result['name'], result['size']))
+        if old:
+            print('{:20} {:>8} {:8.2f}x'.format(
+                result['name'],
+                result['size'],
+                result['seconds'] / old
+            ))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Micro benchmarks of the autotex internals',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter
+    )
+    parser.add_argument(
+        'benchmarks',
+        nargs='*',
+        help='Benchmarks to run (default: all of {})'.format(
+            ', '.join(name for name, _, _ in BENCHMARKS)
+        )
+    )
+    parser.add_argument(
+        '--sizes',
+        type=str,
+        default='100,1000,10000',
+        help='Comma separated problem sizes'
+    )
+    parser.add_argument(
+        '--repeat',
+        type=int,
+        default=5,
+        help='Runs per benchmark, the fastest one is reported'
+    )
+    parser.add_argument(
+        '--output', '-o',
+        type=str,
+        help='Write results to this JSON file'
+    )
+    parser.add_argument(
+        '--compare',
+        type=str,
+        help='JSON file of an earlier run to compare with'
+    )
+    args = parser.parse_args()
+
+    results = run_benchmarks(
+        args.benchmarks,
+        [int(x) for x in args.sizes.split(',')],
+        args.repeat
+    )
+
+    if args.output:
+        with open(args.output, 'w') as outfile:
+            json.dump(
+                {
+                    'revision': git_revision(),
+                    'python': platform.python_version(),
+                    'results': results
+                },
+                outfile,
+                indent=2
+            )
+
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == '__main__':
+    main()
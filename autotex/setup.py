@@ -17,7 +17,8 @@ setup(
     ],
     entry_points={
         'console_scripts': [
-            'autotex = autotex.__main__:run'
+            'autotex = autotex.__main__:run',
+            'autotex-client = autotex.client:main'
         ]
     },
     install_requires=[
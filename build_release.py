@@ -0,0 +1,538 @@
+#!/usr/bin/env python3
+
+import argparse
+import concurrent.futures
+from datetime import date
+import glob
+import hashlib
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tarfile
+import time
+import urllib.request
+import zipfile
+
+BASE = os.path.dirname(os.path.abspath(__file__))
+STATE_NAME = 'state.json'
+STATE_VERSION = 1
+UCD_URL = 'http://www.unicode.org/Public/UCD/latest/ucd/'
+UCD_FILES = ['Blocks.txt', 'UnicodeData.txt']
+RE_UCD_DATE = re.compile(r"^# Date: (\d{4})-(\d{2})-(\d{2})")
+
+
+class Stage(object):
+    """One step of the release
+
+    Every stage writes into its own folder of the cache. It gets skipped
+    when the digest of its inputs and of its dependencies did not change
+    since its last successful run.
+
+    Args:
+        name: stage name, also the name of its folder
+        deps: names of the stages whose folders get used
+        inputs: files and folders of the repository that get used
+        run: function(ctx, dout) that does the work
+        always: if True, the stage runs every time (e.g. downloads) and
+            passes the digest of its output on to its dependents
+        keep: if True, the folder keeps the files of the last run
+
+    """
+    def __init__(self, name, deps, inputs, run, always=False, keep=False):
+        self.name = name
+        self.deps = deps
+        self.inputs = inputs
+        self.run = run
+        self.always = always
+        self.keep = keep
+
+
+# =============================================================================
+# ================= DIGESTS ===================================================
+# =============================================================================
+def list_files(path):
+    """Lists all files of a file or folder, sorted
+
+    Args:
+        path: file or folder
+
+    Returns:
+        Array of file paths
+
+    """
+    if os.path.isfile(path):
+        return [path]
+
+    result = []
+    for root, dirs, files in os.walk(path):
+        dirs[:] = sorted(d for d in dirs if d != '__pycache__')
+        result.extend(os.path.join(root, f) for f in sorted(files))
+    return result
+
+
+def digest_paths(paths):
+    """Computes the content digest of files and folders
+
+    Args:
+        paths: files and folders
+
+    Returns:
+        Hex digest string
+
+    """
+    digest = hashlib.sha256()
+    for path in paths:
+        for fname in list_files(path):
+            digest.update(os.path.relpath(fname, path).encode('utf8'))
+            digest.update(b'\0')
+            with open(fname, 'rb') as fin:
+                digest.update(hashlib.sha256(fin.read()).digest())
+    return digest.hexdigest()
+
+
+def load_state(cache):
+    """Loads the digests of the last run
+
+    Args:
+        cache: cache folder
+
+    Returns:
+        dict {stage name: {'key': digest, 'output': digest}}
+
+    """
+    try:
+        with open(os.path.join(cache, STATE_NAME)) as fstate:
+            state = json.load(fstate)
+    except (IOError, ValueError):
+        return {}
+
+    if state.get('version') != STATE_VERSION:
+        return {}
+    return state.get('stages', {})
+
+
+def save_state(cache, stages):
+    """Stores the digests of this run
+
+    Args:
+        cache: cache folder
+        stages: dict {stage name: {'key': digest, 'output': digest}}
+
+    """
+    with open(os.path.join(cache, STATE_NAME), 'w') as fstate:
+        json.dump(
+            {'version': STATE_VERSION, 'stages': stages},
+            fstate,
+            indent=2,
+            sort_keys=True
+        )
+        fstate.write('\n')
+
+
+# =============================================================================
+# ================= STAGES ====================================================
+# =============================================================================
+def copy_files(sources, dout):
+    """Copies files and folders into a folder
+
+    Args:
+        sources: files and folders
+        dout: target folder
+
+    """
+    for source in sources:
+        target = os.path.join(dout, os.path.basename(source))
+        if os.path.isdir(source):
+            shutil.copytree(
+                source,
+                target,
+                ignore=shutil.ignore_patterns('__pycache__')
+            )
+        else:
+            shutil.copy(source, target)
+
+
+def stage_venv(ctx, dout):
+    subprocess.check_call(
+        [sys.executable, '-m', 'venv', dout],
+        stdout=subprocess.DEVNULL
+    )
+    subprocess.check_call(
+        [
+            os.path.join(dout, 'bin', 'pip'),
+            'install',
+            os.path.join(BASE, 'autotex')
+        ],
+        stdout=subprocess.DEVNULL
+    )
+
+
+def stage_autotex(ctx, dout):
+    copy_files(
+        [
+            os.path.join(BASE, 'autotex', name)
+            for name in ['autotex', 'README.md', 'setup.py']
+        ],
+        dout
+    )
+
+
+def stage_docstrip(ctx, dout):
+    copy_files(
+        [
+            os.path.join(BASE, 'classes', name)
+            for name in ['hyperion.dtx', 'hyperion.ins']
+        ],
+        dout
+    )
+    subprocess.check_call(
+        ['luatex', '-pdf', 'hyperion.ins'],
+        cwd=dout,
+        stdout=subprocess.DEVNULL
+    )
+
+
+def stage_classdoc(ctx, dout):
+    copy_files(list_files(ctx['dirs']['docstrip']), dout)
+    subprocess.check_call(
+        [
+            os.path.join(ctx['dirs']['venv'], 'bin', 'autotex'),
+            'hyperion.dtx'
+        ],
+        cwd=dout,
+        stdout=subprocess.DEVNULL
+    )
+
+
+def stage_ucd(ctx, dout):
+    for name in UCD_FILES:
+        if ctx['ucd']:
+            shutil.copy(os.path.join(ctx['ucd'], name), dout)
+        else:
+            with urllib.request.urlopen(UCD_URL + name) as response:
+                with open(os.path.join(dout, name), 'wb') as fout:
+                    shutil.copyfileobj(response, fout)
+
+
+def package_date(fblocks, fdate):
+    """Determines the date of the generated Unicode packages
+
+    The date is part of the package digests, so it must not change from
+    day to day. It is taken from the header of Blocks.txt, otherwise the
+    date of the first run gets kept.
+
+    Args:
+        fblocks: path of Blocks.txt
+        fdate: file that keeps the date of the first run
+
+    Returns:
+        Date string (YYYY/MM/DD)
+
+    """
+    with open(fblocks) as fin:
+        for line in fin:
+            match = RE_UCD_DATE.match(line)
+            if match:
+                return '/'.join(match.groups())
+            if not line.startswith('#'):
+                break
+
+    try:
+        with open(fdate) as fin:
+            return fin.read().strip()
+    except IOError:
+        pdate = date.today().strftime('%Y/%m/%d')
+        with open(fdate, 'w') as fout:
+            fout.write(pdate + '\n')
+        return pdate
+
+
+def stage_unicode(ctx, dout):
+    # generate.py keeps a manifest, so unchanged blocks stay untouched
+    ucd = ctx['dirs']['ucd']
+    subprocess.check_call(
+        [
+            sys.executable,
+            os.path.join(BASE, 'unicode', 'generate.py'),
+            '--lua',
+            '--blocks', os.path.join(ucd, 'Blocks.txt'),
+            '--data', os.path.join(ucd, 'UnicodeData.txt'),
+            '--date', package_date(
+                os.path.join(ucd, 'Blocks.txt'),
+                os.path.join(dout, 'date.txt')
+            ),
+            '--output', dout
+        ],
+        stdout=subprocess.DEVNULL
+    )
+
+
+def stage_release(ctx, dout):
+    dirs = ctx['dirs']
+    target = os.path.join(dout, 'hyperion')
+    parts = {
+        'autotex': [
+            os.path.join(dirs['autotex'], name)
+            for name in sorted(os.listdir(dirs['autotex']))
+        ],
+        'classes': [os.path.join(dirs['classdoc'], 'hyperion.pdf')] + sorted(
+            glob.glob(os.path.join(dirs['docstrip'], 'hyperion*.cls'))
+        ),
+        'unicode': sorted(
+            f
+            for ext in ['sty', 'def', 'lua']
+            for f in glob.glob(os.path.join(dirs['unicode'], '*.' + ext))
+        ),
+        'random': [
+            os.path.join(BASE, 'random', name)
+            for name in ['bibtex.js', 'publish.sh']
+        ]
+    }
+    for part, sources in sorted(parts.items()):
+        os.makedirs(os.path.join(target, part))
+        copy_files(sources, os.path.join(target, part))
+
+    with zipfile.ZipFile(
+            os.path.join(dout, 'hyperion.zip'),
+            'w',
+            zipfile.ZIP_DEFLATED
+    ) as fzip:
+        for fname in list_files(target):
+            fzip.write(fname, os.path.relpath(fname, dout))
+    with tarfile.open(os.path.join(dout, 'hyperion.tar.gz'), 'w:gz') as ftar:
+        ftar.add(target, 'hyperion')
+
+
+STAGES = (
+    Stage(
+        'venv',
+        [],
+        ['autotex/setup.py', 'autotex/autotex'],
+        stage_venv
+    ),
+    Stage(
+        'autotex',
+        [],
+        ['autotex/setup.py', 'autotex/autotex', 'autotex/README.md'],
+        stage_autotex
+    ),
+    Stage(
+        'docstrip',
+        [],
+        ['classes/hyperion.dtx', 'classes/hyperion.ins'],
+        stage_docstrip
+    ),
+    Stage(
+        'classdoc',
+        ['venv', 'docstrip'],
+        [],
+        stage_classdoc
+    ),
+    Stage(
+        'ucd',
+        [],
+        [],
+        stage_ucd,
+        always=True
+    ),
+    Stage(
+        'unicode',
+        ['ucd'],
+        ['unicode/generate.py'],
+        stage_unicode,
+        keep=True
+    ),
+    Stage(
+        'release',
+        ['autotex', 'docstrip', 'classdoc', 'unicode'],
+        ['random/bibtex.js', 'random/publish.sh'],
+        stage_release
+    )
+)
+
+
+# =============================================================================
+# ================= SCHEDULING ================================================
+# =============================================================================
+def stage_key(stage, ctx, deps):
+    """Computes the digest of everything a stage depends on
+
+    Args:
+        stage: stage
+        ctx: context of this run
+        deps: dict {stage name: output digest} of the dependencies
+
+    Returns:
+        Hex digest string
+
+    """
+    inputs = [os.path.join(BASE, path) for path in stage.inputs]
+    return hashlib.sha256(json.dumps(
+        [stage.name, digest_paths(inputs), [deps[d] for d in stage.deps]],
+        sort_keys=True
+    ).encode('utf8')).hexdigest()
+
+
+def run_stage(stage, ctx, key, last):
+    """Runs a stage, unless its result is still valid
+
+    Args:
+        stage: stage
+        ctx: context of this run
+        key: digest of the inputs of the stage
+        last: state of the stage from the last run
+
+    Returns:
+        dict {'key': digest, 'output': digest}
+
+    """
+    dout = ctx['dirs'][stage.name]
+    if not stage.always and last.get('key') == key \
+            and os.path.isdir(dout):
+        print('{0}: unchanged'.format(stage.name))
+        return last
+
+    if os.path.isdir(dout) and not stage.keep:
+        shutil.rmtree(dout)
+    os.makedirs(dout, exist_ok=True)
+
+    start = time.perf_counter()
+    stage.run(ctx, dout)
+    print('{0}: done ({1:.1f}s)'.format(
+        stage.name,
+        time.perf_counter() - start
+    ))
+
+    # stages that always run only trigger others when their output changed
+    output = digest_paths([dout]) if stage.always else key
+    return {'key': key, 'output': output}
+
+
+def run_stages(stages, ctx, jobs):
+    """Runs all stages, independent ones in parallel
+
+    Args:
+        stages: stages in any order
+        ctx: context of this run
+        jobs: number of stages that run at the same time
+
+    Returns:
+        True if all stages succeeded
+
+    """
+    last = {} if ctx['force'] else load_state(ctx['cache'])
+    state = dict(last)
+    pending = dict((stage.name, stage) for stage in stages)
+    outputs = {}
+    running = {}
+    failed = False
+
+    with concurrent.futures.ThreadPoolExecutor(jobs) as pool:
+        while (pending and not failed) or running:
+            # start all stages whose dependencies are done
+            ready = [
+                stage
+                for stage in pending.values()
+                if all(d in outputs for d in stage.deps)
+            ]
+            for stage in ready if not failed else []:
+                del pending[stage.name]
+                running[pool.submit(
+                    run_stage,
+                    stage,
+                    ctx,
+                    stage_key(stage, ctx, outputs),
+                    last.get(stage.name, {})
+                )] = stage
+
+            done, _ = concurrent.futures.wait(
+                running,
+                return_when=concurrent.futures.FIRST_COMPLETED
+            )
+            for future in done:
+                stage = running.pop(future)
+                try:
+                    state[stage.name] = future.result()
+                    outputs[stage.name] = state[stage.name]['output']
+                except Exception as e:
+                    print('{0}: FAILED ({1})'.format(stage.name, e))
+                    state.pop(stage.name, None)
+                    failed = True
+
+            # finished stages are not lost when a later one fails
+            save_state(ctx['cache'], state)
+
+    return not failed
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Builds the release archives of hyperion',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter
+    )
+    parser.add_argument(
+        '--cache',
+        type=str,
+        default='./.release-cache/',
+        help='Folder that keeps the results of all stages between runs'
+    )
+    parser.add_argument(
+        '--output',
+        type=str,
+        default='./release/',
+        help='Folder that receives hyperion.zip and hyperion.tar.gz'
+    )
+    parser.add_argument(
+        '--ucd',
+        type=str,
+        help='Folder containing Blocks.txt and UnicodeData.txt '
+        '(default: download from ' + UCD_URL + ')'
+    )
+    parser.add_argument(
+        '--force',
+        action='store_true',
+        help='Run all stages, even if their inputs did not change'
+    )
+    parser.add_argument(
+        '--jobs', '-j',
+        type=int,
+        default=os.cpu_count() or 1,
+        help='Number of stages that run at the same time'
+    )
+    args = parser.parse_args()
+
+    if args.ucd:
+        missing = [
+            name
+            for name in UCD_FILES
+            if not os.path.exists(os.path.join(args.ucd, name))
+        ]
+        if missing:
+            parser.error('--ucd folder lacks ' + ', '.join(missing))
+
+    cache = os.path.abspath(args.cache)
+    os.makedirs(cache, exist_ok=True)
+    ctx = {
+        'cache': cache,
+        'dirs': dict(
+            (stage.name, os.path.join(cache, stage.name))
+            for stage in STAGES
+        ),
+        'force': args.force,
+        'ucd': os.path.abspath(args.ucd) if args.ucd else None
+    }
+
+    if not run_stages(STAGES, ctx, args.jobs):
+        exit(1)
+
+    os.makedirs(args.output, exist_ok=True)
+    for name in ['hyperion.zip', 'hyperion.tar.gz']:
+        shutil.copy(os.path.join(ctx['dirs']['release'], name), args.output)
+        print(os.path.join(args.output, name))
+
+
+if __name__ == '__main__':
+    main()
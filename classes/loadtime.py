@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+
+import argparse
+import os
+import shutil
+import statistics
+import subprocess
+import tempfile
+import time
+
+CLASSES = ['artcl', 'book', 'doc', 'standalone']
+PROFILES = (
+    ('full', ''),
+    ('lite', 'lite')
+)
+
+
+def write_document(path, preamble, body):
+    """Writes a minimal LaTeX document
+
+    Args:
+        path: path of the .tex file
+        preamble: LaTeX code from \\documentclass on
+        body: LaTeX code of the document body
+
+    """
+    with open(path, 'w') as fdoc:
+        fdoc.write(
+            '{0}\n'
+            '\\begin{{document}}\n'
+            '{1}\n'
+            '\\end{{document}}\n'
+            .format(preamble, body)
+        )
+
+
+def time_runs(engine, path, dirs, runs):
+    """Compiles a document several times
+
+    Args:
+        engine: TeX engine executable
+        path: path of the .tex file
+        dirs: folders that get searched for TeX and Lua files first
+        runs: number of timed runs
+
+    Returns:
+        Array of wall times in seconds
+
+    """
+    env = os.environ.copy()
+    for var in ['TEXINPUTS', 'LUAINPUTS']:
+        env[var] = os.pathsep.join(
+            [os.path.abspath(d) for d in dirs] + [env.get(var, '')]
+        )
+
+    result = []
+    # the first run fills the file system and font caches
+    for i in range(runs + 1):
+        start = time.perf_counter()
+        subprocess.check_call(
+            [engine, '-interaction=nonstopmode', '-halt-on-error', path],
+            cwd=os.path.dirname(path),
+            env=env,
+            stdout=subprocess.DEVNULL
+        )
+        if i > 0:
+            result.append(time.perf_counter() - start)
+
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Compares the startup time of the hyperion classes '
+        'with all subsystems and with the lite option',
+        epilog='The class files get generated by: luatex hyperion.ins',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter
+    )
+    parser.add_argument(
+        '--classes',
+        type=str,
+        default='.',
+        help='Folder containing the generated class files'
+    )
+    parser.add_argument(
+        '--engine',
+        type=str,
+        default='lualatex',
+        help='TeX engine'
+    )
+    parser.add_argument(
+        '--runs',
+        type=int,
+        default=5,
+        help='Timed runs per class and profile'
+    )
+    args = parser.parse_args()
+
+    if not shutil.which(args.engine):
+        print(args.engine + ' is required but was not found!')
+        exit(1)
+
+    print('{0:20} {1:>9} {2:>9} {3:>8}'.format(
+        'class',
+        'full',
+        'lite',
+        'speedup'
+    ))
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for name in CLASSES:
+            cls = 'hyperion' + name
+            if not os.path.exists(os.path.join(args.classes, cls + '.cls')):
+                print('{0:20} missing {0}.cls'.format(cls))
+                continue
+
+            medians = []
+            for profile, options in PROFILES:
+                path = os.path.join(tmpdir, cls + '-' + profile + '.tex')
+                write_document(
+                    path,
+                    '\\documentclass[{0}]{{{1}}}'.format(options, cls),
+                    'Hello'
+                )
+                medians.append(statistics.median(
+                    time_runs(args.engine, path, [args.classes], args.runs)
+                ))
+            print('{0:20} {1:8.3f}s {2:8.3f}s {3:7.2f}x'.format(
+                cls,
+                medians[0],
+                medians[1],
+                medians[0] / medians[1]
+            ))
+
+
+if __name__ == '__main__':
+    main()
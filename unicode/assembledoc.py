@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+
+import generate
+
+
+def load_doc_manifest(dout):
+    """Loads the documentation manifest written by generate.py
+
+    Args:
+        dout: output directory of generate.py
+
+    Returns:
+        Tuple (output PDF, array of block PDFs in document order)
+
+    """
+    with open(os.path.join(dout, generate.DOC_MANIFEST_NAME)) as fmanifest:
+        manifest = json.load(fmanifest)
+
+    parts = [
+        os.path.join(dout, os.path.splitext(root)[0] + '.pdf')
+        for root in manifest['roots']
+    ]
+    return os.path.join(dout, manifest['output']), parts
+
+
+def is_assembled(output, parts):
+    """Checks if the combined PDF is newer than all of its parts
+
+    Args:
+        output: path of the combined PDF
+        parts: paths of the block PDFs
+
+    Returns:
+        True if nothing has to be done
+
+    """
+    if not os.path.exists(output):
+        return False
+    mtime = os.path.getmtime(output)
+    return all(os.path.getmtime(part) <= mtime for part in parts)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Assembles the block documentation into one PDF',
+        epilog='The block documentation gets compiled in parallel by '
+        'autotex --parallel-roots -w \'out/*' + generate.DOC_SUFFIX
+        + '.tex\'',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter
+    )
+    parser.add_argument(
+        '--output',
+        type=str,
+        default='./out/',
+        help='Output folder of generate.py'
+    )
+    args = parser.parse_args()
+
+    if not shutil.which('pdfunite'):
+        print('pdfunite is required but was not found!')
+        exit(1)
+
+    output, parts = load_doc_manifest(args.output)
+    missing = [part for part in parts if not os.path.exists(part)]
+    if missing:
+        for part in missing:
+            print('missing ' + part)
+        exit(1)
+
+    if is_assembled(output, parts):
+        print(output + ': up to date')
+        return
+
+    subprocess.check_call(['pdfunite'] + parts + [output])
+    print(output + ': done ({0} blocks)'.format(len(parts)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,306 @@
+#!/usr/bin/env python3
+
+import argparse
+import contextlib
+import io
+import json
+import re
+import tempfile
+import time
+import tracemalloc
+import unicodedata
+
+import generate
+
+# ranges that UnicodeData.txt lists as First/Last pair
+RANGES = (
+    ('CJK UNIFIED IDEOGRAPH-', 'CJK Ideograph'),
+    ('HANGUL SYLLABLE ', 'Hangul Syllable'),
+    ('TANGUT IDEOGRAPH-', 'Tangut Ideograph')
+)
+
+
+# =============================================================================
+# ================= DATA ======================================================
+# =============================================================================
+def synthetic_data():
+    """Generates UCD-like data from the unicodedata module
+
+    Blocks.txt is not part of Python, so the blocks are chunks of 128
+    code points, extended to cover whole ranges.
+
+    Returns:
+        Tuple (Blocks.txt content, UnicodeData.txt content)
+
+    """
+    rows = []
+    ranges = []
+    for code in range(0x110000):
+        char = chr(code)
+        name = unicodedata.name(char, '')
+        category = unicodedata.category(char)
+        if not name:
+            if category != 'Cc':
+                continue
+            name = '<control>'
+
+        labels = [label for prefix, label in RANGES if name.startswith(prefix)]
+        if labels:
+            if ranges and ranges[-1][0] == labels[0] \
+                    and ranges[-1][2] == code - 1:
+                ranges[-1][2] = code
+            else:
+                ranges.append([labels[0], code, code])
+            continue
+        rows.append((code, name, category))
+
+    lasts = {}
+    for label, first, last in ranges:
+        rows.append((first, '<{0}, First>'.format(label), 'Lo'))
+        rows.append((last, '<{0}, Last>'.format(label), 'Lo'))
+        lasts[first] = last
+    rows.sort()
+
+    data = ''.join(
+        '{0:04X};{1};{2};0;L;;;;;N;;;;;\n'.format(code, name, category)
+        for code, name, category in rows
+    )
+    chunks = []
+    for code, name, _ in rows:
+        if not chunks or code > chunks[-1][1]:
+            chunks.append([code - code % 128, code - code % 128 + 127])
+        if name.endswith(', First>'):
+            last = lasts[code]
+            chunks[-1][1] = max(chunks[-1][1], last - last % 128 + 127)
+    blocks = ''.join(
+        '{0:04X}..{1:04X}; Synthetic Block {2}\n'.format(
+            begin,
+            end,
+            letters(index)
+        )
+        for index, (begin, end) in enumerate(chunks)
+    )
+    return blocks, data
+
+
+def letters(number):
+    """Spells a number in letters, package names drop hex digits"""
+    result = ''
+    for _ in range(3):
+        number, digit = divmod(number, 26)
+        result = chr(ord('a') + digit) + result
+    return result
+
+
+def read(path):
+    with open(path) as infile:
+        return infile.read()
+
+
+# =============================================================================
+# ================= REFERENCE =================================================
+# =============================================================================
+def reference_convert_name(string, specials=False):
+    """convert_name as it was before precompiled regexes and memoization"""
+    if specials:
+        string = string.replace('-', ' Minus ')
+    string = re.sub(
+        r"[0-9]+",
+        lambda x: ' ' + ' '.join(list(
+            generate.int_to_roman(int(x.group(0)))
+        )) + ' ',
+        string
+    )
+    string = re.sub(r"[^a-zA-Z\s]", '', string)
+    string = string.strip()
+    string = re.sub(r"\s+", ' ', string)
+    return ''.join(
+        x[0].upper() + x[1:].lower()
+        for x in string.split(' ')
+    )
+
+
+# =============================================================================
+# ================= STAGES ====================================================
+# =============================================================================
+def raw_names(data):
+    result = []
+    for line in io.StringIO(data):
+        splitted = line.split(';')
+        result.append(splitted[1] + ' ' + splitted[10])
+    return result
+
+
+def stage_parse_blocks(ctx):
+    ctx['blocks'] = generate.parse_blocks(io.StringIO(ctx['blocks_txt']))
+
+
+def stage_reference_names(ctx):
+    ctx['reference'] = [
+        'USymbol' + reference_convert_name(name, True)
+        for name in ctx['raw']
+    ]
+
+
+def stage_convert_names(ctx):
+    generate.convert_number.cache_clear()
+    ctx['names'] = [generate.symbol_name(name) for name in ctx['raw']]
+
+
+def stage_dedup(ctx):
+    index = set()
+    ctx['unique'] = [
+        generate.unique_name(name, index)
+        for name in ctx['names']
+    ]
+
+
+def stage_parse_data(ctx):
+    ctx['groups'] = generate.parse_data(
+        io.StringIO(ctx['data_txt']),
+        ctx['blocks']
+    )
+
+
+def stage_render(ctx):
+    groups = ctx['groups']
+    files = {}
+    for block, symbols in groups:
+        files.update(generate.create_block_package(
+            block,
+            symbols,
+            '1.0',
+            '2000/01/01'
+        ))
+    pnames = [generate.package_name(block['name']) for block, _ in groups]
+    files.update(generate.create_metapackage(
+        generate.package_name('all'),
+        '1.0',
+        '2000/01/01',
+        pnames
+    ))
+    files.update(generate.create_lazy_package(
+        generate.package_name('all lazy'),
+        '1.0',
+        '2000/01/01',
+        [
+            (pname, [name for _, name, _ in symbols])
+            for pname, (_, symbols) in zip(pnames, groups)
+        ]
+    ))
+    files.update(generate.create_lua_package(
+        generate.package_name('all lua'),
+        '1.0',
+        '2000/01/01',
+        [entry for _, symbols in groups for entry in symbols]
+    ))
+    ctx['files'] = files
+
+
+def stage_write(ctx):
+    generate.write_files(ctx['tmpdir'], ctx['files'])
+
+
+STAGES = (
+    ('parse_blocks', stage_parse_blocks),
+    ('names (reference)', stage_reference_names),
+    ('names', stage_convert_names),
+    ('dedup', stage_dedup),
+    ('parse_data', stage_parse_data),
+    ('render', stage_render),
+    ('write', stage_write)
+)
+
+
+def run_stage(stage, ctx):
+    # stages print their progress, keep it out of the table
+    with contextlib.redirect_stdout(io.StringIO()):
+        stage(ctx)
+
+
+def run_stages(ctx, repeat):
+    results = []
+    for name, stage in STAGES:
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            run_stage(stage, ctx)
+            times.append(time.perf_counter() - start)
+
+        # separate run, tracing slows everything down
+        tracemalloc.start()
+        run_stage(stage, ctx)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+        results.append({'stage': name, 'time': min(times), 'peak': peak})
+        print('{0:18} {1:8.3f}s {2:8.1f}MiB'.format(
+            name,
+            min(times),
+            peak / 2**20
+        ))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Time and memory per stage of generate.py',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter
+    )
+    parser.add_argument(
+        '--blocks',
+        type=str,
+        help='Blocks.txt file (default: synthetic data)'
+    )
+    parser.add_argument(
+        '--data',
+        type=str,
+        help='UnicodeData.txt file (default: synthetic data)'
+    )
+    parser.add_argument(
+        '--repeat',
+        type=int,
+        default=3,
+        help='Timed runs per stage, the fastest one counts'
+    )
+    parser.add_argument(
+        '--output', '-o',
+        type=str,
+        help='Write results to this JSON file'
+    )
+    args = parser.parse_args()
+
+    if bool(args.blocks) != bool(args.data):
+        parser.error('--blocks and --data have to be used together')
+
+    if args.blocks:
+        blocks_txt, data_txt = read(args.blocks), read(args.data)
+    else:
+        blocks_txt, data_txt = synthetic_data()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        ctx = {
+            'blocks_txt': blocks_txt,
+            'data_txt': data_txt,
+            'raw': raw_names(data_txt),
+            'tmpdir': tmpdir
+        }
+        print('{0} rows'.format(len(ctx['raw'])))
+        print('{0:18} {1:>9} {2:>11}'.format('stage', 'time', 'peak'))
+        results = run_stages(ctx, args.repeat)
+
+    if ctx['names'] != ctx['reference']:
+        print('names differ from the reference implementation!')
+        exit(1)
+    timing = {x['stage']: x['time'] for x in results}
+    print('name conversion speedup: {0:.2f}x'.format(
+        timing['names (reference)'] / timing['names']
+    ))
+
+    if args.output:
+        with open(args.output, 'w') as outfile:
+            json.dump({'results': results}, outfile, indent=2)
+
+
+if __name__ == '__main__':
+    main()
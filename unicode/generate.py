@@ -1,9 +1,26 @@
 #!/usr/bin/env python3
 
 import argparse
+import bisect
+import concurrent.futures
 from datetime import date
+import functools
+import hashlib
+import io
+import json
 import os
 import re
+import shutil
+import subprocess
+
+MANIFEST_NAME = 'manifest.json'
+MANIFEST_VERSION = 6
+DOC_MANIFEST_NAME = 'doc.json'
+DOC_SUFFIX = 'Doc'
+
+RE_BLOCK = re.compile(r"([0-9A-F]+)\.{2}([0-9A-F]+);\s+(.+)")
+RE_NUMBER = re.compile(r"[0-9]+")
+RE_ILLEGAL = re.compile(r"[^a-zA-Z\s]")
 
 NUMERAL_MAP = (
     (10000000, 'S'),
@@ -74,7 +91,7 @@ def parse_blocks(fblocks):
     for line in fblocks:
         stripped = line.strip()
         if len(stripped) > 0 and stripped[0] != '#':
-            match = re.match(r"([0-9A-F]+)\.{2}([0-9A-F]+);\s+(.+)", stripped)
+            match = RE_BLOCK.match(stripped)
             result.append({
                 'begin': int(match.group(1), 16),
                 'end': int(match.group(2), 16),
@@ -85,8 +102,9 @@ def parse_blocks(fblocks):
     return result
 
 
+@functools.lru_cache(maxsize=None)
 def convert_number(number):
-    """Converts number to LaTeX name parts
+    """Converts number to LaTeX name parts (memoized)
 
     Args:
         number: positive integer
@@ -114,24 +132,16 @@ def convert_name(string, specials=False):
         string = string.replace('-', ' Minus ')
 
     # convert numbers to roman strings
-    string = re.sub(
-        r"[0-9]+",
+    string = RE_NUMBER.sub(
         lambda x: convert_number(int(x.group(0))),
         string
     )
 
     # strip all illegal characters
-    string = re.sub(r"[^a-zA-Z\s]", '', string)
-
-    # remove unnecessary whitespaces
-    string = string.strip()
-    string = re.sub(r"\s+", ' ', string)
+    string = RE_ILLEGAL.sub('', string)
 
-    # build one string of all words
-    return ''.join(
-        x[0].upper() + x[1:].lower()
-        for x in string.split(' ')
-    )
+    # build one string of all words, split() drops unnecessary whitespaces
+    return ''.join(x.capitalize() for x in string.split())
 
 
 def package_name(string):
@@ -174,32 +184,20 @@ def print_header(name, texfile):
     texfile.write('%--------------------\n')
 
 
-def create_new_package(
-        pname,
-        dout,
-        version,
-        pdate,
-        description,
-        fdocall=None,
-        fall=None
-):
-    """Creates a new LaTeX package
+def open_package(pname, version, pdate, description):
+    """Starts a new LaTeX package in memory and writes its requirements
 
     Args:
         pname: escaped package name
-        dout: output directory
         version: package version string
         pdate: package date (YYYY/MM/DD)
         description: package description
-        fdocall: main documentation .tex file
-        fall: LaTeX package that collects all packages (metapackage)
 
     Returns:
-        File handler of the new LaTeX package file
+        Buffer of the new LaTeX package file
 
     """
-    fpackage = open(dout + '/' + pname + '.sty', 'w')
-    fdoc = open(dout + '/' + pname + '.tex', 'w')
+    fpackage = io.StringIO()
 
     fpackage.write(
         '\\NeedsTeXFormat{{LaTeX2e}}\n'
@@ -223,14 +221,34 @@ def create_new_package(
         .format(pname)
     )
 
-    if fall:
-        fall.write(
-            '\\RequirePackage{{{0}}}\n'
-            .format(pname)
-        )
+    return fpackage
+
+
+def create_new_package(
+        pname,
+        version,
+        pdate,
+        description,
+        pall=False
+):
+    """Creates a new LaTeX package in memory
+
+    Args:
+        pname: escaped package name
+        version: package version string
+        pdate: package date (YYYY/MM/DD)
+        description: package description
+        pall: True if the new package is the metapackage (all)
 
+    Returns:
+        Buffers of the new LaTeX package file and its documentation
+
+    """
+    fpackage = open_package(pname, version, pdate, description)
+    fdoc = io.StringIO()
+
+    if not pall:
         print_header('style', fpackage)
-        pall = package_name('all')
         fpackage.write(
             '\\newcommand{{\\{0}@style}}[1]{{#1}}\n'
             '\\newcommand{{\\{0}Style}}[1]'
@@ -243,11 +261,10 @@ def create_new_package(
             '\\renewcommand{{\\{1}Style}}[1]'
             '{{\\{0}Style{{#1}}\\{0}@list{{#1}}}}%\n'
             '}}\n'
-            .format(pname, pall)
+            .format(pname, package_name('all'))
         )
 
         fdoc.write('\\section{' + pname + '}\n')
-        fdocall.write('\\include{' + pname + '}\n')
     else:
         doc_begin(fdoc)
 
@@ -257,7 +274,7 @@ def create_new_package(
 
 
 def finalize_package(texfile, fdoc, pall=False):
-    """Write final LaTeX package data and close stream
+    """Write final LaTeX package data
 
     Args:
         texfile: LaTeX file
@@ -268,8 +285,6 @@ def finalize_package(texfile, fdoc, pall=False):
     if texfile:
         print_header('end', texfile)
         texfile.write('\\endinput\n')
-        texfile.close()
-        print('done')
 
         if pall:
             doc_end(fdoc)
@@ -278,14 +293,429 @@ def finalize_package(texfile, fdoc, pall=False):
                 '\\endinput\n'
                 '\n'
             )
-            fdoc.close()
 
 
-def doc_begin(fdoc):
+def create_definitions(pname, version, pdate, description):
+    """Creates the symbol definitions file of a block package
+
+    The definitions are global, so the file can also be loaded from
+    inside the document by USymbolAllLazy.
+
+    Args:
+        pname: escaped package name
+        version: package version string
+        pdate: package date (YYYY/MM/DD)
+        description: package description
+
+    Returns:
+        Buffer of the new definitions file
+
+    """
+    fdef = io.StringIO()
+    fdef.write(
+        '\\ProvidesFile{{{0}.def}}[{1} v{2} {3}]\n'
+        .format(pname, pdate, version, description)
+    )
+    print_header('symbols', fdef)
+
+    return fdef
+
+
+def finalize_definitions(fdef):
+    """Write final definitions data
+
+    Args:
+        fdef: definitions file
+
+    """
+    print_header('end', fdef)
+    fdef.write('\\endinput\n')
+
+
+def create_block_package(block, symbols, version, pdate):
+    """Creates the package of one block
+
+    Args:
+        block: parsed block
+        symbols: array of tuples (hnumber, escaped symbol name, hlast)
+        version: package version string
+        pdate: package date (YYYY/MM/DD)
+
+    Returns:
+        dict {file name: content}
+
+    """
+    pname = package_name(block['name'])
+    description = (
+        'Provides macros for Unicode symbols of block {0}'
+        .format(block['name'])
+    )
+    fpackage, fdoc = create_new_package(
+        pname=pname,
+        version=version,
+        pdate=pdate,
+        description=description
+    )
+    fpackage.write('\\input{' + pname + '.def}\n')
+    fdef = create_definitions(
+        pname=pname,
+        version=version,
+        pdate=pdate,
+        description=description
+    )
+    for hnumber, name, hlast in symbols:
+        print_symbol(fdef, name, hnumber, pname, fdoc, hlast)
+    finalize_definitions(fdef)
+    finalize_package(fpackage, fdoc)
+
+    return {
+        pname + '.sty': fpackage.getvalue(),
+        pname + '.def': fdef.getvalue(),
+        pname + '.tex': fdoc.getvalue(),
+        pname + DOC_SUFFIX + '.tex': create_doc_root(pname)
+    }
+
+
+def create_doc_root(pname):
+    """Creates the standalone documentation of one block
+
+    Unlike USymbolAll.tex, the root only loads the package of its own
+    block, so all blocks can be compiled independently and in parallel.
+
+    Args:
+        pname: escaped package name
+
+    Returns:
+        Content of the documentation root
+
+    """
+    fdoc = io.StringIO()
+    doc_begin(fdoc, pname)
+    fdoc.write('\\input{' + pname + '}\n')
+    doc_end(fdoc)
+
+    return fdoc.getvalue()
+
+
+def create_metapackage(pname, version, pdate, pnames):
+    """Creates the metapackage that loads all block packages
+
+    Args:
+        pname: escaped package name
+        version: package version string
+        pdate: package date (YYYY/MM/DD)
+        pnames: escaped package names of all blocks
+
+    Returns:
+        dict {file name: content}
+
+    """
+    fall, fdocall = create_new_package(
+        pname=pname,
+        version=version,
+        pdate=pdate,
+        description='Provides macros for all Unicode symbols',
+        pall=True
+    )
+    for pblock in pnames:
+        fall.write('\\RequirePackage{' + pblock + '}\n')
+        fdocall.write('\\include{' + pblock + '}\n')
+    finalize_package(fall, fdocall, True)
+
+    return {
+        pname + '.sty': fall.getvalue(),
+        pname + '.tex': fdocall.getvalue()
+    }
+
+
+def print_font_style(pname, fpackage):
+    """Prints the shared font style of the metapackages to a LaTeX file
+
+    Symbols that are not defined by a block package use \\USymbolAll@font,
+    which \\USymbolAllStyle sets in addition to all block styles.
+
+    Args:
+        pname: escaped package name
+        fpackage: LaTeX package file
+
+    """
+    print_header('style', fpackage)
+    fpackage.write(
+        '\\providecommand{{\\{1}@font}}{{}}\n'
+        '\\@ifundefined{{{1}Style}}%\n'
+        '{{%\n'
+        '\\newcommand{{\\{1}Style}}[1]'
+        '{{\\renewcommand{{\\{1}@font}}{{#1}}}}%\n'
+        '}}{{%\n'
+        '\\let\\{0}@list\\{1}Style%\n'
+        '\\renewcommand{{\\{1}Style}}[1]'
+        '{{\\renewcommand{{\\{1}@font}}{{#1}}\\{0}@list{{#1}}}}%\n'
+        '}}\n'
+        .format(pname, package_name('all'))
+    )
+
+
+def create_lazy_package(pname, version, pdate, groups):
+    """Creates the metapackage that loads blocks on first use
+
+    Every symbol macro starts as a protected stub. The first stub that
+    gets used loads the definitions of its block, which replace all
+    stubs of that block.
+
+    Args:
+        pname: escaped package name
+        version: package version string
+        pdate: package date (YYYY/MM/DD)
+        groups: array of tuples (escaped block package name, [symbol names])
+
+    Returns:
+        dict {file name: content}
+
+    """
+    fpackage = open_package(
+        pname,
+        version,
+        pdate,
+        'Provides macros for all Unicode symbols, loaded on demand'
+    )
+    pall = package_name('all')
+    print_font_style(pname, fpackage)
+
+    print_header('loader', fpackage)
+    fpackage.write(
+        '\\newcommand{{\\{0}@load}}[1]{{%\n'
+        '\\@ifundefined{{#1@style}}{{%\n'
+        '\\expandafter\\gdef\\csname #1@style\\endcsname##1'
+        '{{{{\\{0}@font##1}}}}%\n'
+        '}}{{}}%\n'
+        '\\begingroup\\makeatletter\\endlinechar=\\m@ne'
+        '\\input{{#1.def}}\\endgroup%\n'
+        '}}\n'
+        '\\newcommand{{\\{0}@stub}}[2]{{%\n'
+        '\\ifdefined#1\\else\\protected\\gdef#1{{\\{0}@load{{#2}}#1}}\\fi%\n'
+        '}}\n'
+        '\\newcommand{{\\{0}@block}}[2]{{%\n'
+        '\\@tfor\\{0}@cs:=#2\\do'
+        '{{\\expandafter\\{0}@stub\\{0}@cs{{#1}}}}%\n'
+        '}}\n'
+        .format(pall)
+    )
+
+    print_header('symbols', fpackage)
+    for block, names in groups:
+        fpackage.write('\\' + pall + '@block{' + block + '}{%\n')
+        for name in names:
+            fpackage.write('\\' + name + '\n')
+        fpackage.write('}\n')
+
+    print_header('end', fpackage)
+    fpackage.write('\\endinput\n')
+
+    return {pname + '.sty': fpackage.getvalue()}
+
+
+def create_lua_module(pname, version, pdate, symbols):
+    """Creates the Lua module that maps symbol names to code points
+
+    Args:
+        pname: escaped package name
+        version: package version string
+        pdate: package date (YYYY/MM/DD)
+        symbols: array of tuples (hnumber, escaped symbol name, hlast)
+
+    Returns:
+        Buffer of the Lua module
+
+    """
+    prefix = 'USymbol'
+    fmodule = io.StringIO()
+
+    fmodule.write(
+        '-- {0}.lua {1} v{2}\n'
+        '-- Code points of all Unicode symbols, generated for {0}.sty\n'
+        '\n'
+        'local codes = {{\n'
+        .format(pname, pdate, version)
+    )
+    for hnumber, name, hlast in symbols:
+        if not hlast:
+            fmodule.write(name[len(prefix):] + '=0x' + hnumber + ',\n')
+    fmodule.write(
+        '}\n'
+        '\n'
+        'local ranges = {\n'
+    )
+    for hnumber, name, hlast in symbols:
+        if hlast:
+            fmodule.write(
+                name[len(prefix):] + '={0x' + hnumber + ', 0x' + hlast + '},\n'
+            )
+    fmodule.write(
+        '}}\n'
+        '\n'
+        'local {0} = {{}}\n'
+        '\n'
+        '-- code point of a symbol name, with or without prefix\n'
+        'function {0}.code(name)\n'
+        '    local code = codes[name] or codes[(name:gsub("^{1}", ""))]\n'
+        '    if not code then\n'
+        '        tex.error("Unknown Unicode symbol " .. name)\n'
+        '        code = 0xFFFD\n'
+        '    end\n'
+        '    return code\n'
+        'end\n'
+        '\n'
+        '-- code point inside of a range, given as hex string\n'
+        'function {0}.range_code(name, hnumber)\n'
+        '    local range = ranges[name] or ranges[(name:gsub("^{1}", ""))]\n'
+        '    local code = tonumber(hnumber, 16)\n'
+        '    if not (range and code and code >= range[1] and code <= range[2])'
+        ' then\n'
+        '        tex.error("Unknown Unicode symbol " .. name .. " "'
+        ' .. hnumber)\n'
+        '        code = 0xFFFD\n'
+        '    end\n'
+        '    return code\n'
+        'end\n'
+        '\n'
+        '-- writes the code point as TeX number\n'
+        'function {0}.write(name)\n'
+        '    tex.write(string.format(\'"%X\', {0}.code(name)))\n'
+        'end\n'
+        '\n'
+        '-- writes the code point inside of a range as TeX number\n'
+        'function {0}.write_range(name, hnumber)\n'
+        '    local code = {0}.range_code(name, hnumber)\n'
+        '    tex.write(string.format(\'"%X\', code))\n'
+        'end\n'
+        '\n'
+        '-- defines the symbol macros of the block packages\n'
+        'function {0}.define()\n'
+        '    for name, code in pairs(codes) do\n'
+        '        token.set_macro(\n'
+        '            "{1}" .. name,\n'
+        '            string.format(\'\\\\{2}@symbol{{"%X}}\', code),\n'
+        '            "global"\n'
+        '        )\n'
+        '    end\n'
+        '    for name in pairs(ranges) do\n'
+        '        token.set_macro(\n'
+        '            "{1}" .. name,\n'
+        '            string.format(\'\\\\usymbolrange{{%s}}\', name),\n'
+        '            "global"\n'
+        '        )\n'
+        '    end\n'
+        'end\n'
+        '\n'
+        'return {0}\n'
+        .format(pname, prefix, package_name('all'))
+    )
+
+    return fmodule
+
+
+def create_lua_package(pname, version, pdate, symbols):
+    """Creates the LuaLaTeX metapackage that looks up symbols in Lua
+
+    Instead of defining one macro per symbol, \\usymbol{<name>} gets the
+    code point from a Lua table. The package option macros defines the
+    usual symbol macros from that table.
+
+    Args:
+        pname: escaped package name
+        version: package version string
+        pdate: package date (YYYY/MM/DD)
+        symbols: array of tuples (hnumber, escaped symbol name, hlast)
+
+    Returns:
+        dict {file name: content}
+
+    """
+    fmodule = create_lua_module(pname, version, pdate, symbols)
+    fpackage = open_package(
+        pname,
+        version,
+        pdate,
+        'Provides all Unicode symbols through a Lua table'
+    )
+    fpackage.write(
+        '\\ifluatex\n'
+        '\\else\n'
+        '\\PackageError{{{0}}}{{LuaLaTeX required!}}%\n'
+        '{{Please use LuaLaTeX or load {1} instead.}}\n'
+        '\\fi\n'
+        .format(pname, package_name('all'))
+    )
+
+    print_header('options', fpackage)
+    fpackage.write(
+        '\\newif\\if{0}@macros\n'
+        '\\DeclareOption{{macros}}{{\\{0}@macrostrue}}\n'
+        '\\ProcessOptions\\relax\n'
+        .format(pname)
+    )
+
+    print_font_style(pname, fpackage)
+
+    print_header('symbols', fpackage)
+    fpackage.write(
+        '\\directlua{{%\n'
+        '    local path = kpse.find_file("{0}.luc", "lua")\n'
+        '        or kpse.find_file("{0}.lua", "lua")\n'
+        '    if not path then\n'
+        '        error("{0}: {0}.lua not found")\n'
+        '    end\n'
+        '    {0} = dofile(path)\n'
+        '}}\n'
+        '\\newcommand{{\\{1}@symbol}}[1]{{{{\\{1}@font\\symbol{{#1}}}}}}\n'
+        '\\newcommand{{\\usymbol}}[1]'
+        '{{\\{1}@symbol{{\\directlua'
+        '{{{0}.write("\\luaescapestring{{#1}}")}}}}}}\n'
+        '\\newcommand{{\\usymbolrange}}[2]'
+        '{{\\{1}@symbol{{\\directlua{{{0}.write_range('
+        '"\\luaescapestring{{#1}}", "\\luaescapestring{{#2}}")}}}}}}\n'
+        '\\if{0}@macros\n'
+        '\\directlua{{{0}.define()}}\n'
+        '\\fi\n'
+        .format(pname, package_name('all'))
+    )
+
+    print_header('end', fpackage)
+    fpackage.write('\\endinput\n')
+
+    return {
+        pname + '.sty': fpackage.getvalue(),
+        pname + '.lua': fmodule.getvalue()
+    }
+
+
+def compile_lua_module(pname, dout, luac):
+    """Compiles the Lua module to bytecode or removes stale bytecode
+
+    Args:
+        pname: escaped package name
+        dout: output directory
+        luac: if True, the Lua module gets compiled to bytecode
+
+    """
+    fbytecode = dout + '/' + pname + '.luc'
+    if luac:
+        subprocess.check_call([
+            'texluac',
+            '-s',
+            '-o', fbytecode,
+            dout + '/' + pname + '.lua'
+        ])
+    elif os.path.exists(fbytecode):
+        os.remove(fbytecode)
+
+
+def doc_begin(fdoc, pname=None):
     """Creates new main documentation file
 
     Args:
         fdoc: documentation TeX file
+        pname: escaped name of the documented package, default: metapackage
 
     """
     fdoc.write(
@@ -307,22 +737,21 @@ def doc_begin(fdoc):
         '}}\n'
         '\n'
         '\\begin{{document}}\n'
-        .format(package_name('all'))
+        .format(pname or package_name('all'))
     )
 
 
 def doc_end(fdoc):
-    """Finalize and close documentation file
+    """Finalize documentation file
 
     Args:
         fdoc: documentation .tex file
 
     """
     fdoc.write('\\end{document}\n')
-    fdoc.close()
 
 
-def print_symbol(texfile, name, hnumber, pname, fdoc):
+def print_symbol(texfile, name, hnumber, pname, fdoc, hlast=None):
     """Prints a symbol definition to a LaTeX file
 
     Args:
@@ -331,10 +760,15 @@ def print_symbol(texfile, name, hnumber, pname, fdoc):
         hnumber: hexnumber string
         pname: escaped package name
         fdoc: documentation .tex file
+        hlast: hexnumber string of the last code point, if name is a range
 
     """
+    if hlast:
+        print_range(texfile, name, hnumber, hlast, pname, fdoc)
+        return
+
     texfile.write(
-        '\\newcommand{{\\{0}}}{{\\{1}@style{{\\symbol{{"{2}}}}}}}\n'
+        '\\gdef\\{0}{{\\{1}@style{{\\symbol{{"{2}}}}}}}\n'
         .format(name, pname, hnumber)
     )
     fdoc.write(
@@ -343,31 +777,68 @@ def print_symbol(texfile, name, hnumber, pname, fdoc):
     )
 
 
-def process_data(fdata, blocks, dout, version, datestring):
-    """Processes UnicodeData.txt
+def print_range(texfile, name, hfirst, hlast, pname, fdoc):
+    """Prints the definition of a code point range to a LaTeX file
+
+    The range gets one macro that takes the code point (hexnumber) as
+    argument instead of one macro per code point.
+
+    Args:
+        texfile: LaTeX file
+        name: escpaed range name
+        hfirst: hexnumber string of the first code point
+        hlast: hexnumber string of the last code point
+        pname: escaped package name
+        fdoc: documentation .tex file
+
+    """
+    texfile.write(
+        '\\gdef\\{0}#1{{\\{1}@style{{\\symbol{{"#1}}}}}}\n'
+        .format(name, pname)
+    )
+    fdoc.write(
+        '\\symboldemo{{{0}..{1}}}{{{2}\\{{\\var{{hexnumber}}\\}}}}'
+        '{{\\{2}{{{0}}}}}\n'
+        .format(hfirst, hlast, name)
+    )
+
+
+def unique_name(name_base, index):
+    """Prevents duplicate names, first come first serve
+
+    Args:
+        name_base: escaped symbol name
+        index: set of all names that are already taken, gets updated
+
+    Returns:
+        name_base with a counter appended if it is already taken
+
+    """
+    name = name_base
+    counter = 1
+    while name in index:
+        counter += 1
+        name = name_base + convert_name(str(counter))
+    index.add(name)
+
+    return name
+
+
+def parse_data(fdata, blocks):
+    """Parses UnicodeData.txt and assigns the symbols to their blocks
 
     Args:
         fdata: UnicodeData.txt file handler
         blocks: parsed blocks
-        dout: output directory
-        version: package version string
-        datestring: date string (YYYY/MM/DD)
+
+    Returns:
+        Array of tuples (block, [(hnumber, escaped symbol name, hlast)]),
+        hlast is only set for code point ranges
 
     """
-    print('')
-    print('---Process data---')
-    fall, fdocall = create_new_package(
-        pname=package_name('all'),
-        dout=dout,
-        version=version,
-        pdate=datestring,
-        description='Provides macros for all Unicode symbols',
-    )
-    fpackage = None
-    fdoc = None
-    blockiter = iter(blocks)
-    end = None
-    pname = None
+    print('Parse data: ', end='')
+    begins = [block['begin'] for block in blocks]
+    groups = {}
     index = set()
 
     for line in fdata:
@@ -376,39 +847,315 @@ def process_data(fdata, blocks, dout, version, datestring):
         hnumber = splitted[0]
         name1 = splitted[1]
         name2 = splitted[10]
-        name_base = symbol_name(name1 + ' ' + name2)
-        name = name_base
-
-        # prevent duplicate names
-        counter = 1
-        while name in index:
-            counter += 1
-            name = name_base + convert_name(str(counter))
-        index.add(name)
-
-        # next block?
-        if (not fpackage) or (int(hnumber, 16) > end):
-            finalize_package(fpackage, fdoc)
-
-            block = next(blockiter)
-            print(block['name'] + ': ', end='')
-            end = block['end']
-            pname = package_name(block['name'])
-            fpackage, fdoc = create_new_package(
-                pname=pname,
-                dout=dout,
-                version=version,
-                pdate=datestring,
-                description='Provides macros for Unicode symbols of block {0}'
-                .format(block['name']),
-                fall=fall,
-                fdocall=fdocall
+
+        # find block
+        number = int(hnumber, 16)
+        i = bisect.bisect_right(begins, number) - 1
+        if i < 0 or number > blocks[i]['end']:
+            continue
+        symbols = groups.setdefault(i, [])
+
+        # ranges are given by a First/Last pair and become one symbol
+        if name1.endswith(', Last>'):
+            hfirst, name, _ = symbols.pop()
+            symbols.append((hfirst, name, hnumber))
+            continue
+        if name1.endswith(', First>'):
+            name1 = name1[:-len(', First>')]
+
+        name = unique_name(symbol_name(name1 + ' ' + name2), index)
+        symbols.append((hnumber, name, None))
+
+    print('done')
+    return [(blocks[i], groups[i]) for i in sorted(groups)]
+
+
+def compute_digest(settings, entries):
+    """Computes the content digest of a generated package
+
+    Args:
+        settings: dict of generator settings that end up in the output
+        entries: JSON serializable content of the package
+
+    Returns:
+        Hex digest string
+
+    """
+    return hashlib.sha256(json.dumps(
+        [MANIFEST_VERSION, settings, entries],
+        sort_keys=True
+    ).encode('utf8')).hexdigest()
+
+
+def load_manifest(dout):
+    """Loads the manifest of the last run
+
+    Args:
+        dout: output directory
+
+    Returns:
+        dict {package name: digest}, empty if there is no usable manifest
+
+    """
+    try:
+        with open(dout + '/' + MANIFEST_NAME) as fmanifest:
+            manifest = json.load(fmanifest)
+    except (IOError, ValueError):
+        return {}
+
+    if manifest.get('version') != MANIFEST_VERSION:
+        return {}
+    return manifest.get('packages', {})
+
+
+def save_manifest(dout, packages):
+    """Stores the manifest of this run
+
+    Args:
+        dout: output directory
+        packages: dict {package name: digest}
+
+    """
+    with open(dout + '/' + MANIFEST_NAME, 'w') as fmanifest:
+        json.dump(
+            {'version': MANIFEST_VERSION, 'packages': packages},
+            fmanifest,
+            indent=2,
+            sort_keys=True
+        )
+        fmanifest.write('\n')
+
+
+def save_doc_manifest(dout, pnames):
+    """Stores the documentation roots in the order of the combined PDF
+
+    The file only gets written if its content changed, so tools that
+    watch it do not rebuild anything without need.
+
+    Args:
+        dout: output directory
+        pnames: escaped package names of all blocks
+
+    """
+    content = json.dumps(
+        {
+            'output': package_name('all') + '.pdf',
+            'roots': [pname + DOC_SUFFIX + '.tex' for pname in pnames]
+        },
+        indent=2,
+        sort_keys=True
+    ) + '\n'
+
+    path = dout + '/' + DOC_MANIFEST_NAME
+    try:
+        with open(path) as fmanifest:
+            if fmanifest.read() == content:
+                return
+    except IOError:
+        pass
+
+    with open(path, 'w') as fmanifest:
+        fmanifest.write(content)
+
+
+def is_current(pname, digest, manifest, dout, extensions):
+    """Checks if a package on disk matches its digest
+
+    Args:
+        pname: escaped package name
+        digest: digest of the package content
+        manifest: manifest of the last run
+        dout: output directory
+        extensions: file extensions the package consists of
+
+    Returns:
+        True if the package does not have to be written again
+
+    """
+    return manifest.get(pname) == digest and all(
+        os.path.exists(dout + '/' + pname + ext)
+        for ext in extensions
+    )
+
+
+def print_report(report):
+    """Prints which packages were touched by this run
+
+    Args:
+        report: dict {state: [escaped package names]}
+
+    """
+    print('')
+    print('---Report---')
+    for state in ['added', 'changed', 'removed']:
+        for pname in report[state]:
+            print('{0:8} {1}'.format(state, pname))
+    print('{0} added, {1} changed, {2} removed, {3} unchanged'.format(
+        len(report['added']),
+        len(report['changed']),
+        len(report['removed']),
+        len(report['unchanged'])
+    ))
+
+
+def write_files(dout, files):
+    """Writes rendered files, one write per file
+
+    Args:
+        dout: output directory
+        files: dict {file name: content}
+
+    """
+    for fname, content in files.items():
+        with open(dout + '/' + fname, 'w') as fout:
+            fout.write(content)
+
+
+def render_packages(renders, jobs):
+    """Renders packages, in parallel if more than one job is allowed
+
+    Args:
+        renders: array of tuples (escaped package name, function, args)
+        jobs: number of worker processes
+
+    Returns:
+        Iterator of tuples (escaped package name, {file name: content})
+        in the order of renders
+
+    """
+    if jobs <= 1 or len(renders) <= 1:
+        for pname, function, args in renders:
+            yield pname, function(*args)
+        return
+
+    with concurrent.futures.ProcessPoolExecutor(jobs) as executor:
+        futures = [
+            (pname, executor.submit(function, *args))
+            for pname, function, args in renders
+        ]
+        for pname, future in futures:
+            yield pname, future.result()
+
+
+def process_data(
+        fdata,
+        blocks,
+        dout,
+        version,
+        datestring,
+        force=False,
+        lua=False,
+        luac=False,
+        jobs=1
+):
+    """Processes UnicodeData.txt
+
+    Only packages whose digest differs from the manifest of the last run
+    get written, all other files stay untouched.
+
+    Args:
+        fdata: UnicodeData.txt file handler
+        blocks: parsed blocks
+        dout: output directory
+        version: package version string
+        datestring: date string (YYYY/MM/DD)
+        force: if True, all packages get written
+        lua: if True, the LuaLaTeX metapackage gets written
+        luac: if True, the Lua module of that package gets compiled
+        jobs: number of worker processes that render packages
+
+    Raises:
+        ValueError: if two blocks get the same package name
+
+    """
+    groups = parse_data(fdata, blocks)
+    manifest = {} if force else load_manifest(dout)
+    settings = {'version': version, 'date': datestring}
+    packages = {}
+    renders = []
+    report = {'added': [], 'changed': [], 'removed': [], 'unchanged': []}
+
+    def schedule(pname, entries, extensions, function, *args):
+        # the manifest is keyed by package name, files must not collide
+        if pname in packages:
+            raise ValueError(
+                'Package {0} would be written twice, '
+                'block names collide'.format(pname)
             )
+        digest = compute_digest(settings, entries)
+        packages[pname] = digest
 
-        print_symbol(fpackage, name, hnumber, pname, fdoc)
+        if is_current(pname, digest, manifest, dout, extensions):
+            report['unchanged'].append(pname)
+        else:
+            report['changed' if pname in manifest else 'added'].append(pname)
+            renders.append((pname, function, args))
+
+    for block, symbols in groups:
+        schedule(
+            package_name(block['name']),
+            [block, symbols],
+            ['.sty', '.def', '.tex', DOC_SUFFIX + '.tex'],
+            create_block_package,
+            block, symbols, version, datestring
+        )
 
-    finalize_package(fpackage, fdoc)
-    finalize_package(fall, fdocall, True)
+    # the metapackage only depends on the list of blocks
+    pall = package_name('all')
+    pnames = [package_name(block['name']) for block, _ in groups]
+    schedule(
+        pall,
+        pnames,
+        ['.sty', '.tex'],
+        create_metapackage,
+        pall, version, datestring, pnames
+    )
+
+    # the lazy metapackage needs the symbol names of all blocks
+    plazy = package_name('all lazy')
+    stubs = [
+        (package_name(block['name']), [name for _, name, _ in symbols])
+        for block, symbols in groups
+    ]
+    schedule(
+        plazy,
+        stubs,
+        ['.sty'],
+        create_lazy_package,
+        plazy, version, datestring, stubs
+    )
+
+    # the Lua metapackage needs all symbols in one table
+    plua = package_name('all lua')
+    if lua:
+        table = [entry for _, symbols in groups for entry in symbols]
+        schedule(
+            plua,
+            [luac, table],
+            ['.sty', '.lua'] + (['.luc'] if luac else []),
+            create_lua_package,
+            plua, version, datestring, table
+        )
+
+    print('')
+    print('---Process data---')
+    for pname, files in render_packages(renders, jobs):
+        write_files(dout, files)
+        if pname == plua:
+            compile_lua_module(pname, dout, luac)
+        print(pname + ': done')
+
+    # blocks that vanished from the data
+    for pname in sorted(set(manifest).difference(packages)):
+        report['removed'].append(pname)
+        for ext in ['.sty', '.def', '.tex', DOC_SUFFIX + '.tex',
+                    '.lua', '.luc']:
+            if os.path.exists(dout + '/' + pname + ext):
+                os.remove(dout + '/' + pname + ext)
+
+    save_manifest(dout, packages)
+    save_doc_manifest(dout, pnames)
+    print_report(report)
 
 
 def main():
@@ -448,9 +1195,34 @@ def main():
         default="1.0",
         help='Version of the generated packages'
     )
+    parser.add_argument(
+        '--force',
+        action='store_true',
+        help='Write all packages, even if the manifest says they are current'
+    )
+    parser.add_argument(
+        '--lua',
+        action='store_true',
+        help='Also write the LuaLaTeX metapackage backed by a Lua table'
+    )
+    parser.add_argument(
+        '--luac',
+        action='store_true',
+        help='Compile the Lua table with texluac (implies --lua, the '
+        'bytecode only works with the LuaTeX version of that texluac)'
+    )
+    parser.add_argument(
+        '--jobs', '-j',
+        type=int,
+        default=os.cpu_count() or 1,
+        help='Number of worker processes that render packages'
+    )
 
     args = parser.parse_args()
 
+    if args.luac and not shutil.which('texluac'):
+        parser.error('--luac requires texluac')
+
     if not os.path.exists(args.output):
         os.makedirs(args.output)
 
@@ -462,7 +1234,11 @@ def main():
         blocks=blocks,
         dout=args.output,
         version=args.version,
-        datestring=args.date
+        datestring=args.date,
+        force=args.force,
+        lua=args.lua or args.luac,
+        luac=args.luac,
+        jobs=args.jobs
     )
     args.data.close()
 
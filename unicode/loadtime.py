@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+
+import argparse
+import os
+import shutil
+import statistics
+import subprocess
+import tempfile
+import time
+
+VARIANTS = (
+    ('macros', 'USymbolAll', '', '\\{0}'),
+    ('lazy', 'USymbolAllLazy', '', '\\{0}'),
+    ('lua', 'USymbolAllLua', '', '\\usymbol{{{1}}}'),
+    ('lua-macros', 'USymbolAllLua', 'macros', '\\{0}')
+)
+
+
+def write_document(path, preamble, body):
+    """Writes a minimal LaTeX document
+
+    Args:
+        path: path of the .tex file
+        preamble: LaTeX code from \\documentclass on
+        body: LaTeX code of the document body
+
+    """
+    with open(path, 'w') as fdoc:
+        fdoc.write(
+            '{0}\n'
+            '\\begin{{document}}\n'
+            '{1}\n'
+            '\\end{{document}}\n'
+            .format(preamble, body)
+        )
+
+
+def time_runs(engine, path, dirs, runs):
+    """Compiles a document several times
+
+    Args:
+        engine: TeX engine executable
+        path: path of the .tex file
+        dirs: folders that get searched for TeX and Lua files first
+        runs: number of timed runs
+
+    Returns:
+        Array of wall times in seconds
+
+    """
+    env = os.environ.copy()
+    for var in ['TEXINPUTS', 'LUAINPUTS']:
+        env[var] = os.pathsep.join(
+            [os.path.abspath(d) for d in dirs] + [env.get(var, '')]
+        )
+
+    result = []
+    # the first run fills the file system and font caches
+    for i in range(runs + 1):
+        start = time.perf_counter()
+        subprocess.check_call(
+            [engine, '-interaction=nonstopmode', '-halt-on-error', path],
+            cwd=os.path.dirname(path),
+            env=env,
+            stdout=subprocess.DEVNULL
+        )
+        if i > 0:
+            result.append(time.perf_counter() - start)
+
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Compares the load time of the Unicode metapackages',
+        epilog='The repository does not record reference times, run it '
+        'on the machine that builds the documents',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter
+    )
+    parser.add_argument(
+        '--output',
+        type=str,
+        default='./out/',
+        help='Folder containing the generated packages'
+    )
+    parser.add_argument(
+        '--engine',
+        type=str,
+        default='lualatex',
+        help='TeX engine'
+    )
+    parser.add_argument(
+        '--runs',
+        type=int,
+        default=5,
+        help='Timed runs per variant'
+    )
+    parser.add_argument(
+        '--symbol',
+        type=str,
+        default='USymbolRightwardsArrow',
+        help='Symbol macro used by the test document'
+    )
+    args = parser.parse_args()
+
+    if not shutil.which(args.engine):
+        print(args.engine + ' is required but was not found!')
+        exit(1)
+
+    print('{0:12} {1:>9} {2:>9} {3:>9}'.format(
+        'variant',
+        'min',
+        'median',
+        'max'
+    ))
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for variant, package, options, usage in VARIANTS:
+            if not os.path.exists(os.path.join(args.output, package + '.sty')):
+                print('{0:12} missing {1}.sty'.format(variant, package))
+                continue
+
+            path = os.path.join(tmpdir, variant + '.tex')
+            write_document(
+                path,
+                '\\documentclass{{article}}\n'
+                '\\usepackage[{0}]{{{1}}}'.format(options, package),
+                usage.format(args.symbol, args.symbol[len('USymbol'):])
+            )
+            times = time_runs(args.engine, path, [args.output], args.runs)
+            print('{0:12} {1:8.3f}s {2:8.3f}s {3:8.3f}s'.format(
+                variant,
+                min(times),
+                statistics.median(times),
+                max(times)
+            ))
+
+
+if __name__ == '__main__':
+    main()